@@ -1,33 +1,62 @@
 #!/usr/bin/env python3
 """MS/TP CRC Verification Tool - Captures frames and verifies standard BACnet CRC"""
+import functools
 import serial
+import struct
 import sys
 
+def _crc8_step(temp):
+    """One byte of the Annex G.1 header CRC, given C7..C0 XOR D7..D0"""
+    # Exclusive OR the terms in the table (top down): temp ^ (temp << 1) ^ ... ^ (temp << 7),
+    # built by doubling so each step XORs in twice as many shifted copies
+    temp ^= temp << 1
+    temp ^= temp << 2
+    temp ^= temp << 4
+    # Combine bits shifted out left hand end
+    return (temp & 0xfe) ^ ((temp >> 8) & 1)
+
+# Header CRC lookup table, indexed by (crc ^ byte)
+CRC8_TABLE = bytes(_crc8_step(i) for i in range(256))
+
 def calc_standard_crc(data):
     """Standard BACnet MS/TP CRC-8 per ASHRAE 135 Annex G.1
     Uses polynomial X^8 + X^7 + 1 (same as Wireshark implementation)"""
     crc = 0xFF
     for byte in data:
-        # XOR C7..C0 with D7..D0
-        temp = crc ^ byte
-        # Exclusive OR the terms in the table (top down)
-        temp = temp ^ (temp << 1) ^ (temp << 2) ^ (temp << 3) ^ (temp << 4) ^ (temp << 5) ^ (temp << 6) ^ (temp << 7)
-        # Combine bits shifted out left hand end
-        crc = (temp & 0xfe) ^ ((temp >> 8) & 1)
+        crc = CRC8_TABLE[crc ^ byte]
+    return (~crc) & 0xFF
+
+@functools.lru_cache(maxsize=4096)
+def calc_header_crc(frame_type, dest, src, length):
+    """Standard CRC of a header by field; a bus reuses a handful of headers, so this is mostly a cache hit"""
+    # Headers are always 5 bytes: same as calc_standard_crc, unrolled
+    crc = CRC8_TABLE[0xFF ^ frame_type]
+    crc = CRC8_TABLE[crc ^ dest]
+    crc = CRC8_TABLE[crc ^ src]
+    crc = CRC8_TABLE[crc ^ (length >> 8)]
+    crc = CRC8_TABLE[crc ^ (length & 0xFF)]
     return (~crc) & 0xFF
 
+def _empirical_step(crc):
+    """Eight LSB-first shifts with poly 0x81"""
+    for _ in range(8):
+        if crc & 0x01:
+            crc = (crc >> 1) ^ 0x81
+        else:
+            crc >>= 1
+    return crc
+
+# Empirical CRC lookup table, indexed by (crc ^ byte) like CRC8_TABLE
+EMPIRICAL_TABLE = bytes(_empirical_step(i) for i in range(256))
+
 def calc_empirical_crc(data):
-    """Empirical CRC that was matching JCI traffic"""
+    """Empirical CRC that was matching JCI traffic
+    Originally: reverse each byte, MSB-first poly 0x81, reverse the result, XOR 0xFF.
+    0x81 is its own bit-reversal, so that is the same as LSB-first 0x81 with no reversals."""
     crc = 0xFF
     for byte in data:
-        reflected_byte = int('{:08b}'.format(byte)[::-1], 2)  # reverse bits
-        crc ^= reflected_byte
-        for _ in range(8):
-            if crc & 0x80:
-                crc = ((crc << 1) ^ 0x81) & 0xFF
-            else:
-                crc = (crc << 1) & 0xFF
-    return int('{:08b}'.format(crc)[::-1], 2) ^ 0xFF  # reverse bits and XOR
+        crc = EMPIRICAL_TABLE[crc ^ byte]
+    return crc ^ 0xFF
 
 FRAME_TYPES = {
     0: "Token",
@@ -40,6 +69,9 @@ FRAME_TYPES = {
     7: "ReplyPostponed"
 }
 
+# Frame type, dest, src, length (big-endian), header CRC - starting after the preamble
+MSTP_HEADER = struct.Struct('>BBBHB')
+
 port = sys.argv[1] if len(sys.argv) > 1 else '/dev/ttyACM0'
 baud = int(sys.argv[2]) if len(sys.argv) > 2 else 38400
 
@@ -56,65 +88,82 @@ print(f"{'Frame':<6} {'Type':<15} {'Dst':<4} {'Src':<4} {'Len':<5} {'RX CRC':<8}
 print("-" * 100)
 
 buffer = bytearray()
+pos = 0  # read cursor into buffer; consumed bytes are dropped once per read
 frame_count = 0
 std_match = 0
 emp_match = 0
 
+# Hot-loop methods bound once instead of looked up per frame
+read = ser.read
+extend = buffer.extend
+find = buffer.find
+unpack_header = MSTP_HEADER.unpack_from
+frame_type_name = FRAME_TYPES.get
+rows = []  # formatted frame lines, written out in one block per serial read
+append_row = rows.append
+
 try:
     while True:
-        data = ser.read(256)
+        # Drain whatever the driver has queued in one call rather than 256 bytes at a time
+        data = read(max(256, ser.in_waiting))
         if data:
-            buffer.extend(data)
-
-        while len(buffer) >= 8:
-            try:
-                idx = buffer.index(0x55)
-                if idx > 0:
-                    buffer = buffer[idx:]
-                if len(buffer) < 2 or buffer[1] != 0xFF:
-                    buffer = buffer[1:]
-                    continue
-
-                if len(buffer) < 8:
-                    break
-
-                frame_type = buffer[2]
-                dest = buffer[3]
-                src = buffer[4]
-                length = (buffer[5] << 8) | buffer[6]
-                rx_crc = buffer[7]
-
-                header = bytes(buffer[2:7])
-                std_crc = calc_standard_crc(header)
-                emp_crc = calc_empirical_crc(header)
-
-                frame_count += 1
-
-                if rx_crc == std_crc:
-                    std_match += 1
-                    result = "STD-OK"
-                elif rx_crc == emp_crc:
+            extend(data)
+
+        while len(buffer) - pos >= 8:
+            # Preamble and sync byte in one scan
+            pos = find(b'\x55\xff', pos)
+            if pos < 0:
+                # Keep the last byte: it may be the 0x55 of a preamble split across reads
+                pos = len(buffer) - 1
+                break
+
+            if len(buffer) - pos < 8:
+                break
+
+            frame_type, dest, src, length, rx_crc = unpack_header(buffer, pos + 2)
+
+            std_crc = calc_header_crc(frame_type, dest, src, length)
+
+            frame_count += 1
+
+            # The empirical CRC is only worth computing when the standard one misses
+            if rx_crc == std_crc:
+                std_match += 1
+                result = "STD-OK"
+                emp_col = "--"
+            else:
+                emp_crc = calc_empirical_crc(buffer[pos + 2:pos + 7])
+                emp_col = f"0x{emp_crc:02X}"
+                if rx_crc == emp_crc:
                     emp_match += 1
                     result = "EMP-OK"
                 else:
                     result = "FAIL"
 
-                ftype_name = FRAME_TYPES.get(frame_type, f"Unknown({frame_type})")
-                rate = f"{100*std_match/frame_count:.1f}% std"
+            ftype_name = frame_type_name(frame_type) or f"Unknown({frame_type})"
+            rate = f"{100*std_match/frame_count:.1f}% std"
 
-                print(f"{frame_count:<6} {ftype_name:<15} {dest:<4} {src:<4} {length:<5} 0x{rx_crc:02X}     0x{std_crc:02X}     0x{emp_crc:02X}     {result:<10} {rate}")
+            append_row(f"{frame_count:<6} {ftype_name:<15} {dest:<4} {src:<4} {length:<5} 0x{rx_crc:02X}     0x{std_crc:02X}     {emp_col:<4}     {result:<10} {rate}")
 
-                frame_size = 8 + (length + 2 if length > 0 else 0)
-                if len(buffer) >= frame_size:
-                    buffer = buffer[frame_size:]
-                else:
-                    break
-
-            except ValueError:
-                buffer.clear()
+            frame_size = 8 + (length + 2 if length > 0 else 0)
+            if len(buffer) - pos >= frame_size:
+                pos += frame_size
+            else:
                 break
 
+        if pos:
+            del buffer[:pos]
+            pos = 0
+
+        if rows:
+            rows.append("")
+            sys.stdout.write("\n".join(rows))
+            sys.stdout.flush()
+            rows.clear()
+
 except KeyboardInterrupt:
+    if rows:
+        print("\n".join(rows))
     print(f"\n" + "=" * 100)
     print(f"SUMMARY:")
     print(f"  Total frames: {frame_count}")
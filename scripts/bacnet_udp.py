@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Batched UDP send/receive for the gateway test scripts.
+
+On Linux, sendmmsg(2)/recvmmsg(2) move a whole batch of datagrams per system
+call through ctypes. Elsewhere, or if libc lacks them, the same functions fall
+back to one sendto()/recvfrom_into() per datagram.
+"""
+
+import ctypes
+import errno
+import os
+import select
+import selectors
+import socket
+import struct
+import sys
+
+# Datagrams taken per recvmmsg call, and the most bytes kept of each
+RECV_BATCH = 32
+RECV_BUF_SIZE = 1500
+
+MSG_DONTWAIT = 0x40
+
+# sockaddr_in as recvmmsg fills it in: family (skipped), port, IPv4 address
+_SOCKADDR_IN = struct.Struct('>2xH4s')
+
+# Most messages sendmmsg takes per call (UIO_MAXIOV)
+SEND_BATCH_MAX = 1024
+
+# Seconds send_batch waits for room in a full send buffer, unless the socket has a timeout
+SEND_WAIT = 5.0
+
+# Kernel UDP buffer size requested, in bytes
+SOCKET_BUF_SIZE = 4 * 1024 * 1024
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(_IOVec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+_recvmmsg = _sendmmsg = None
+if sys.platform.startswith('linux'):
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _recvmmsg = _libc.recvmmsg
+        _recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint,
+                              ctypes.c_int, ctypes.c_void_p]
+        _recvmmsg.restype = ctypes.c_int
+        _sendmmsg = _libc.sendmmsg
+        _sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+        _sendmmsg.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        _recvmmsg = _sendmmsg = None
+
+
+class BatchReceiver:
+    """Takes every queued datagram off a UDP socket in one recvmmsg(2) call on Linux
+
+    Elsewhere (or if libc has no recvmmsg) it drains the socket with recvfrom_into() until
+    it would block. Either way the socket is non-blocking and waited on with a selector, so
+    an idle wait sleeps for exactly the time asked.
+
+    Datagrams land in one preallocated buffer and come back as memoryview slices of it,
+    so they are only valid until the next receive().
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(sock, selectors.EVENT_READ)
+        # One buffer slot per message, reused by every call
+        self.pool = bytearray(RECV_BUF_SIZE * RECV_BATCH)
+        self.view = memoryview(self.pool)
+        if _recvmmsg is None:
+            return
+        # Plus a sockaddr_in per message, and the iovecs/headers recvmmsg fills in
+        self.names = (ctypes.c_char * (16 * RECV_BATCH))()
+        self.iovs = (_IOVec * RECV_BATCH)()
+        self.msgs = (_MMsgHdr * RECV_BATCH)()
+        buf_base = ctypes.addressof((ctypes.c_char * len(self.pool)).from_buffer(self.pool))
+        name_base = ctypes.addressof(self.names)
+        for i in range(RECV_BATCH):
+            self.iovs[i].iov_base = buf_base + i * RECV_BUF_SIZE
+            self.iovs[i].iov_len = RECV_BUF_SIZE
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_name = name_base + i * 16
+            hdr.msg_iov = ctypes.pointer(self.iovs[i])
+            hdr.msg_iovlen = 1
+
+    def receive(self, timeout):
+        """Wait up to timeout seconds and return [(data, addr), ...]; empty if nothing came"""
+        # Try the socket before waiting on it: in a burst of replies the next ones are usually
+        # already queued, and finding them costs one system call instead of two
+        packets = self._drain()
+        if packets or not self.selector.select(timeout):
+            return packets
+        return self._drain()
+
+    def _drain(self):
+        """Take whatever is queued on the socket without waiting"""
+        if _recvmmsg is None:
+            packets = []
+            for start in range(0, len(self.pool), RECV_BUF_SIZE):
+                try:
+                    nbytes, addr = self.sock.recvfrom_into(self.view[start:start + RECV_BUF_SIZE])
+                except BlockingIOError:
+                    break
+                packets.append((self.view[start:start + nbytes], addr))
+            return packets
+
+        for i in range(RECV_BATCH):
+            self.msgs[i].msg_hdr.msg_namelen = 16
+        count = _recvmmsg(self.sock.fileno(), self.msgs, RECV_BATCH, MSG_DONTWAIT, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise OSError(err, os.strerror(err))
+
+        packets = []
+        for i in range(count):
+            # Without MSG_TRUNC, msg_len is the bytes received: a longer datagram is cut to RECV_BUF_SIZE
+            size = self.msgs[i].msg_len
+            data = self.view[i * RECV_BUF_SIZE:i * RECV_BUF_SIZE + size]
+            port, ip = _SOCKADDR_IN.unpack_from(self.names, i * 16)
+            addr = (socket.inet_ntoa(ip), port)
+            packets.append((data, addr))
+        return packets
+
+    def close(self):
+        self.selector.close()
+
+
+def enlarge_socket_buffers(sock, warn=None):
+    """Ask for SOCKET_BUF_SIZE kernel buffers, so a burst of replies isn't dropped
+
+    A buffer the kernel capped is reported through warn(message), or printed
+    if no callback is given.
+    """
+    for opt, name, limit in ((socket.SO_RCVBUF, 'SO_RCVBUF', 'rmem_max'),
+                             (socket.SO_SNDBUF, 'SO_SNDBUF', 'wmem_max')):
+        sock.setsockopt(socket.SOL_SOCKET, opt, SOCKET_BUF_SIZE)
+        granted = sock.getsockopt(socket.SOL_SOCKET, opt)
+        if granted < SOCKET_BUF_SIZE:
+            message = f"{name} capped at {granted} bytes (raise net.core.{limit})"
+            if warn:
+                warn(message)
+            else:
+                print(f"WARNING: {message}")
+
+
+def send_batch(sock, packets, addr):
+    """Send every packet in packets to addr, in as few sendmmsg(2) calls as the kernel allows"""
+    if _sendmmsg is None or not packets:
+        for packet in packets:
+            sock.sendto(packet, addr)
+        return
+
+    # One destination for every message: sockaddr_in in host-order family, network-order port
+    ip, port = addr
+    name = ctypes.create_string_buffer(
+        struct.pack('=H', socket.AF_INET) + struct.pack('>H', port)
+        + socket.inet_aton(socket.gethostbyname(ip)), 16)
+    count = len(packets)
+    iovs = (_IOVec * count)()
+    msgs = (_MMsgHdr * count)()
+    # c_char_p points straight at each bytes object's data; packets keeps them alive
+    for i, packet in enumerate(packets):
+        iovs[i].iov_base = ctypes.cast(ctypes.c_char_p(packet), ctypes.c_void_p)
+        iovs[i].iov_len = len(packet)
+        hdr = msgs[i].msg_hdr
+        hdr.msg_name = ctypes.addressof(name)
+        hdr.msg_namelen = 16
+        hdr.msg_iov = ctypes.pointer(iovs[i])
+        hdr.msg_iovlen = 1
+
+    sent = 0
+    while sent < count:
+        batch = min(count - sent, SEND_BATCH_MAX)
+        first = ctypes.cast(ctypes.addressof(msgs[sent]), ctypes.POINTER(_MMsgHdr))
+        n = _sendmmsg(sock.fileno(), first, batch, 0)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                # Non-blocking (or timeout-mode) socket with a full send buffer
+                if not select.select([], [sock], [], sock.gettimeout() or SEND_WAIT)[1]:
+                    raise socket.timeout("timed out waiting for send buffer space")
+                continue
+            raise OSError(err, os.strerror(err))
+        sent += n
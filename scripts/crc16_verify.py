@@ -1,19 +1,15 @@
 #!/usr/bin/env python3
 """Verify MS/TP CRC-16 calculation against known good frames."""
 
+from mstp_crc import crc16_modbus, crc16_register
+
+
 def calculate_data_crc_ccitt(data: bytes) -> int:
     """
     Calculate MS/TP data CRC-16 per ASHRAE 135 Annex G.2
     Uses CRC-CCITT polynomial: x^16 + x^12 + x^5 + 1 (reflected form: 0x8408)
     """
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 0x0001:
-                crc = (crc >> 1) ^ 0x8408
-            else:
-                crc >>= 1
+    crc = crc16_register(data)
     return (~crc) & 0xFFFF
 
 
@@ -22,15 +18,7 @@ def calculate_data_crc_modbus(data: bytes) -> int:
     Calculate CRC-16 MODBUS (polynomial 0xA001) for comparison.
     NOT the correct algorithm for MS/TP, but including for comparison.
     """
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 0x0001:
-                crc = (crc >> 1) ^ 0xA001
-            else:
-                crc >>= 1
-    return crc
+    return crc16_modbus(data)
 
 
 def check_crc_ccitt_with_crc(data_with_crc: bytes) -> int:
@@ -39,14 +27,7 @@ def check_crc_ccitt_with_crc(data_with_crc: bytes) -> int:
     the result should be a constant "good CRC" value.
     Per ASHRAE 135 Annex G: good_crc = 0xF0B8
     """
-    crc = 0xFFFF
-    for byte in data_with_crc:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 0x0001:
-                crc = (crc >> 1) ^ 0x8408
-            else:
-                crc >>= 1
+    crc = crc16_register(data_with_crc)
     return crc  # Should be 0xF0B8 for valid frame (NOT inverted)
 
 
@@ -1,17 +1,11 @@
 #!/usr/bin/env python3
 """Test CRC implementations against known BACnet MS/TP test vectors"""
 
+import mstp_crc
+
 def crc8_header_python(data):
     """Calculate 8-bit CRC for MS/TP header - Python implementation from mstp_test_sender.py"""
-    crc = 0xFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 1:
-                crc = (crc >> 1) ^ 0x8C
-            else:
-                crc >>= 1
-    return (~crc) & 0xFF
+    return mstp_crc.crc8_header(data)
 
 def crc8_header_rust_style(data):
     """Simulate the Rust implementation from mstp_driver.rs"""
@@ -31,15 +25,7 @@ def crc8_header_rust_style(data):
 
 def crc16_data_python(data):
     """Calculate 16-bit CRC for MS/TP data - CRC-CCITT (0x8408)"""
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 1:
-                crc = (crc >> 1) ^ 0x8408
-            else:
-                crc >>= 1
-    return (~crc) & 0xFFFF
+    return mstp_crc.crc16_data(data)
 
 # Test vectors for MS/TP
 # Token frame: type=0, dest=6, src=3, len=0
@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
 """Simple MS/TP frame capture and decoder"""
 
+import asyncio
 import sys
 import serial
+import struct
 import time
 from datetime import datetime
 
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
 FRAME_TYPES = {
     0: "Token",
     1: "PollForMaster",
@@ -17,6 +24,121 @@ FRAME_TYPES = {
     7: "ReplyPostponed",
 }
 
+# Frame type, dest, src, length (big-endian), header CRC - starting after the preamble
+MSTP_HEADER = struct.Struct('>BBBHB')
+
+CAPTURE_SECONDS = 15
+
+class FrameCapture:
+    """Frame parser and per-station counters, fed raw bytes by either serial loop"""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.frame_count = 0
+
+        # Track PFM to station 3 (our M5Stack) and responses
+        self.pfm_to_3 = 0
+        self.reply_from_3 = 0
+        self.token_to_3 = 0
+
+    def feed(self, data):
+        """Append received bytes and report every complete frame in the buffer"""
+        buf = self.buf
+        buf.extend(data)
+        pos = 0  # read cursor into buf; consumed bytes are dropped once per feed
+
+        # Hot-loop methods bound once instead of looked up per frame
+        find = buf.find
+        unpack_header = MSTP_HEADER.unpack_from
+        frame_type_name = FRAME_TYPES.get
+
+        while len(buf) - pos >= 8:
+            # Find preamble and sync byte in one scan
+            pos = find(b'\x55\xff', pos)
+            if pos < 0:
+                # Keep the last byte: it may be the 0x55 of a preamble split across reads
+                pos = len(buf) - 1
+                break
+
+            if len(buf) - pos < 8:
+                break
+
+            # Parse header
+            ftype, dest, src, data_len, hcrc = unpack_header(buf, pos + 2)
+
+            frame_size = 8 if data_len == 0 else 8 + data_len + 2
+
+            if len(buf) - pos < frame_size:
+                break
+
+            # Got complete frame
+            self.frame_count += 1
+            ftype_name = frame_type_name(ftype) or f"Unknown({ftype})"
+
+            ts = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+
+            # Track specific frames
+            if ftype == 1 and dest == 3:  # PFM to station 3
+                self.pfm_to_3 += 1
+                print(f"[{ts}] *** PFM -> 3: src={src} (count={self.pfm_to_3})")
+            elif ftype == 2 and src == 3:  # Reply from station 3
+                self.reply_from_3 += 1
+                print(f"[{ts}] *** REPLY from 3 -> {dest} (count={self.reply_from_3})")
+            elif ftype == 0 and dest == 3:  # Token to station 3
+                self.token_to_3 += 1
+                print(f"[{ts}] *** TOKEN -> 3: src={src} (count={self.token_to_3})")
+            elif ftype == 0:  # Other tokens
+                print(f"[{ts}] Token: {src} -> {dest}")
+            elif ftype == 1:  # Other PFM
+                print(f"[{ts}] PFM: {src} -> {dest}")
+            elif ftype >= 5:  # Data frames
+                print(f"[{ts}] {ftype_name}: {src} -> {dest} len={data_len}")
+
+            pos += frame_size
+
+        if pos:
+            del buf[:pos]
+
+    def print_summary(self):
+        print("=" * 70)
+        print(f"Capture Summary:")
+        print(f"  Total frames: {self.frame_count}")
+        print(f"  PFM to station 3: {self.pfm_to_3}")
+        print(f"  Reply from station 3: {self.reply_from_3}")
+        print(f"  Token to station 3: {self.token_to_3}")
+
+class CaptureProtocol(asyncio.Protocol):
+    """pyserial-asyncio protocol: parse bytes as soon as the event loop delivers them"""
+
+    def __init__(self, capture):
+        self.capture = capture
+
+    def data_received(self, data):
+        self.capture.feed(data)
+
+async def capture_async(port, baud, capture):
+    """Capture for CAPTURE_SECONDS without blocking on serial read timeouts"""
+    loop = asyncio.get_running_loop()
+    transport, _ = await serial_asyncio.create_serial_connection(
+        loop, lambda: CaptureProtocol(capture), port, baudrate=baud)
+    try:
+        await asyncio.sleep(CAPTURE_SECONDS)
+    finally:
+        transport.close()
+
+def capture_blocking(port, baud, capture):
+    """Fallback when pyserial-asyncio is not installed: poll serial.Serial in a loop"""
+    ser = serial.Serial(port=port, baudrate=baud, timeout=0.1)
+    try:
+        start = time.time()
+        while time.time() - start < CAPTURE_SECONDS:
+            # Drain whatever the driver has queued in one call rather than 256 bytes at a time
+            data = ser.read(max(256, ser.in_waiting))
+            if data:
+                capture.feed(data)
+    finally:
+        ser.close()
+
 def main():
     port = sys.argv[1] if len(sys.argv) > 1 else '/dev/ttyACM1'
     baud = int(sys.argv[2]) if len(sys.argv) > 2 else 38400
@@ -24,88 +146,16 @@ def main():
     print(f"MS/TP Capture - {port} @ {baud} baud")
     print("=" * 70)
 
-    ser = serial.Serial(port=port, baudrate=baud, timeout=0.1)
-
-    buf = bytearray()
-    frame_count = 0
-
-    # Track PFM to station 3 (our M5Stack) and responses
-    pfm_to_3 = 0
-    reply_from_3 = 0
-    token_to_3 = 0
-
+    capture = FrameCapture()
     try:
-        start = time.time()
-        while time.time() - start < 15:  # 15 second capture
-            data = ser.read(256)
-            if data:
-                buf.extend(data)
-
-            # Parse frames from buffer
-            while len(buf) >= 8:
-                # Find preamble
-                try:
-                    idx = buf.index(0x55)
-                    if idx > 0:
-                        buf = buf[idx:]
-                    if len(buf) < 2 or buf[1] != 0xFF:
-                        buf = buf[1:]
-                        continue
-                except ValueError:
-                    buf.clear()
-                    continue
-
-                if len(buf) < 8:
-                    break
-
-                # Parse header
-                ftype = buf[2]
-                dest = buf[3]
-                src = buf[4]
-                data_len = (buf[5] << 8) | buf[6]
-                hcrc = buf[7]
-
-                frame_size = 8 if data_len == 0 else 8 + data_len + 2
-
-                if len(buf) < frame_size:
-                    break
-
-                # Got complete frame
-                frame_count += 1
-                ftype_name = FRAME_TYPES.get(ftype, f"Unknown({ftype})")
-
-                ts = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-
-                # Track specific frames
-                if ftype == 1 and dest == 3:  # PFM to station 3
-                    pfm_to_3 += 1
-                    print(f"[{ts}] *** PFM -> 3: src={src} (count={pfm_to_3})")
-                elif ftype == 2 and src == 3:  # Reply from station 3
-                    reply_from_3 += 1
-                    print(f"[{ts}] *** REPLY from 3 -> {dest} (count={reply_from_3})")
-                elif ftype == 0 and dest == 3:  # Token to station 3
-                    token_to_3 += 1
-                    print(f"[{ts}] *** TOKEN -> 3: src={src} (count={token_to_3})")
-                elif ftype == 0:  # Other tokens
-                    print(f"[{ts}] Token: {src} -> {dest}")
-                elif ftype == 1:  # Other PFM
-                    print(f"[{ts}] PFM: {src} -> {dest}")
-                elif ftype >= 5:  # Data frames
-                    print(f"[{ts}] {ftype_name}: {src} -> {dest} len={data_len}")
-
-                buf = buf[frame_size:]
-
+        if serial_asyncio is not None:
+            asyncio.run(capture_async(port, baud, capture))
+        else:
+            capture_blocking(port, baud, capture)
     except KeyboardInterrupt:
         pass
-    finally:
-        ser.close()
 
-    print("=" * 70)
-    print(f"Capture Summary:")
-    print(f"  Total frames: {frame_count}")
-    print(f"  PFM to station 3: {pfm_to_3}")
-    print(f"  Reply from station 3: {reply_from_3}")
-    print(f"  Token to station 3: {token_to_3}")
+    capture.print_summary()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Shared MS/TP CRC kernels (ASHRAE 135 Annex G) for the scripts in this directory.
+
+Header CRC-8 is a byte-at-a-time table. Data CRC-16 uses the fastest backend
+available: fastcrc (SIMD), crcmod's C tables, a Numba-compiled loop, and
+finally binascii.crc_hqx from the standard library.
+
+Usage: python mstp_crc.py <hex bytes>   - print both CRCs of the given bytes
+"""
+
+import binascii
+import sys
+
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:
+    np = None
+
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit when Numba is not installed: run as plain Python."""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# Native CRC-16 backends, fastest first: fastcrc (SIMD), then crcmod's C tables.
+# CRC-16/IBM-SDLC (a.k.a. X-25) is exactly the MS/TP data CRC: reflected 0x8408,
+# init 0xFFFF, final XOR 0xFFFF.
+try:
+    from fastcrc import crc16 as _fastcrc16
+    _native_crc16_mstp = _fastcrc16.ibm_sdlc
+    _native_crc16_modbus = _fastcrc16.modbus
+except ImportError:
+    try:
+        import crcmod.predefined
+        _native_crc16_mstp = crcmod.predefined.mkCrcFun('x-25')
+        _native_crc16_modbus = crcmod.predefined.mkCrcFun('modbus')
+    except ImportError:
+        _native_crc16_mstp = _native_crc16_modbus = None
+
+
+def _crc8_step(crc: int) -> int:
+    """Shift one byte through the reflected poly 0x8C, bit by bit."""
+    for _ in range(8):
+        if crc & 1:
+            crc = (crc >> 1) ^ 0x8C
+        else:
+            crc >>= 1
+    return crc
+
+
+# Header CRC-8 table, indexed by (crc ^ byte)
+CRC8_TABLE = bytes(_crc8_step(i) for i in range(256))
+
+
+def crc8_header(data: bytes) -> int:
+    """MS/TP header CRC-8 per ASHRAE 135 Annex G.1 (poly 0x8C reflected, init/xorout 0xFF)."""
+    crc = 0xFF
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return (~crc) & 0xFF
+
+
+@njit(cache=True)
+def _crc16_reflected(data, crc, poly):
+    """Bit-serial LSB-first CRC-16 loop, compiled to native code when Numba is available."""
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 0x0001:
+                crc = (crc >> 1) ^ poly
+            else:
+                crc >>= 1
+    return crc
+
+
+def _as_array(data: bytes):
+    """Zero-copy uint8 view for the JIT kernel; plain bytes for the Python fallback."""
+    return np.frombuffer(data, dtype=np.uint8) if np is not None else data
+
+
+# Bit-reversal of every byte value, usable with bytes.translate()
+REV8 = bytes(int(f'{i:08b}'[::-1], 2) for i in range(256))
+
+
+def _rev16(value: int) -> int:
+    """Mirror the 16 bits of a CRC register."""
+    return (REV8[value & 0xFF] << 8) | REV8[value >> 8]
+
+
+def crc16_register(data: bytes, crc: int = 0xFFFF) -> int:
+    """
+    Reflected CRC-CCITT (0x8408) register after `data`, not inverted.
+    Without Numba, binascii.crc_hqx runs the MSB-first CCITT (0x1021) in C;
+    mirroring the input bytes and the register turns it into the reflected form.
+    """
+    if _native_crc16_mstp is not None and crc == 0xFFFF:
+        return (~_native_crc16_mstp(bytes(data))) & 0xFFFF
+    if np is not None:
+        return _crc16_reflected(_as_array(data), crc, 0x8408)
+    return _rev16(binascii.crc_hqx(bytes(data).translate(REV8), _rev16(crc)))
+
+
+def crc16_data(data: bytes) -> int:
+    """MS/TP data CRC-16 per ASHRAE 135 Annex G.2, as transmitted (low byte first on the wire)."""
+    return (~crc16_register(data)) & 0xFFFF
+
+
+def crc16_modbus(data: bytes) -> int:
+    """CRC-16 MODBUS (poly 0xA001) - not used by MS/TP, kept for comparisons."""
+    if _native_crc16_modbus is not None:
+        return _native_crc16_modbus(bytes(data))
+    return _crc16_reflected(_as_array(data), 0xFFFF, 0xA001)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    payload = bytes.fromhex(''.join(sys.argv[1:]))
+    print(f"CRC-8 (header): 0x{crc8_header(payload):02X}")
+    print(f"CRC-16 (data):  0x{crc16_data(payload):04X}")
@@ -8,17 +8,22 @@ This script simulates an MS/TP master station that:
 3. Can send/receive BACnet data frames
 
 Usage:
-    python3 mstp_simulator.py <serial_port> [baud] [mac_address]
+    python3 mstp_simulator.py <serial_port> [baud] [mac_address] [-q]
+
+    -q  only log events (tokens, polls, discovery, errors), not every frame
 
 Example:
     python3 mstp_simulator.py /dev/ttyACM1 38400 4
 """
 
+import bisect
 import sys
 import serial
 import time
 import struct
-from datetime import datetime
+
+from mstp_crc import crc16_data
+from timestamps import timestamp
 
 # MS/TP Frame Types per ASHRAE 135 Clause 9
 FRAME_TOKEN = 0x00
@@ -30,22 +35,27 @@ FRAME_BACNET_DATA_EXPECTING_REPLY = 0x05
 FRAME_BACNET_DATA_NOT_EXPECTING_REPLY = 0x06
 FRAME_REPLY_POSTPONED = 0x07
 
-FRAME_NAMES = {
-    0x00: "Token",
-    0x01: "Poll-For-Master",
-    0x02: "Reply-To-Poll-For-Master",
-    0x03: "Test_Request",
-    0x04: "Test_Response",
-    0x05: "BACnet-Data-Expecting-Reply",
-    0x06: "BACnet-Data-Not-Expecting-Reply",
-    0x07: "Reply-Postponed",
-}
+# Frame names, indexed by frame type
+FRAME_NAMES = (
+    "Token",  # 0x00
+    "Poll-For-Master",  # 0x01
+    "Reply-To-Poll-For-Master",  # 0x02
+    "Test_Request",  # 0x03
+    "Test_Response",  # 0x04
+    "BACnet-Data-Expecting-Reply",  # 0x05
+    "BACnet-Data-Not-Expecting-Reply",  # 0x06
+    "Reply-Postponed",  # 0x07
+)
 
 # Timing parameters (in seconds)
 T_REPLY_DELAY = 0.000250  # 250us max reply delay
 T_SLOT = 0.010  # 10ms slot time
 T_USAGE_TIMEOUT = 0.050  # 50ms
 
+# Log levels
+LOG_EVENTS = 0  # tokens, polls, discovery, errors
+LOG_FRAMES = 1  # ...and every frame sent or received
+
 # ANSI colors
 class C:
     RESET = '\033[0m'
@@ -57,71 +67,68 @@ class C:
     CYAN = '\033[96m'
 
 
+def _crc8_header_step(temp):
+    """Fold one byte of the header CRC, given C7..C0 XOR D7..D0."""
+    # Exclusive OR the terms in the table (top down)
+    # This implements the polynomial X^8 + X^7 + 1
+    temp = (temp
+        ^ (temp << 1)
+        ^ (temp << 2)
+        ^ (temp << 3)
+        ^ (temp << 4)
+        ^ (temp << 5)
+        ^ (temp << 6)
+        ^ (temp << 7)) & 0xFFFF
+
+    # Combine bits shifted out left hand end
+    return ((temp & 0xFE) ^ ((temp >> 8) & 1)) & 0xFF
+
+
+# Header CRC lookup table, indexed by (crc ^ byte)
+_CRC8_HDR_TABLE = bytes(_crc8_header_step(i) for i in range(256))
+
+
 def crc8_header(data):
     """Calculate MS/TP header CRC (CRC-8) per ASHRAE 135 Annex G.1.
 
     Uses polynomial X^8 + X^7 + 1.
     """
     crc = 0xFF
-
     for byte in data:
-        # XOR C7..C0 with D7..D0
-        temp = (crc ^ byte) & 0xFF
-
-        # Exclusive OR the terms in the table (top down)
-        # This implements the polynomial X^8 + X^7 + 1
-        temp = (temp
-            ^ (temp << 1)
-            ^ (temp << 2)
-            ^ (temp << 3)
-            ^ (temp << 4)
-            ^ (temp << 5)
-            ^ (temp << 6)
-            ^ (temp << 7)) & 0xFFFF
-
-        # Combine bits shifted out left hand end
-        crc = ((temp & 0xFE) ^ ((temp >> 8) & 1)) & 0xFF
-
+        crc = _CRC8_HDR_TABLE[crc ^ byte]
     return (~crc) & 0xFF
 
 
-def crc16_data(data):
-    """Calculate MS/TP data CRC (CRC-16) per Annex G.2."""
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 1:
-                crc = (crc >> 1) ^ 0x8408  # CRC-CCITT (NOT 0xA001 which is MODBUS)
-            else:
-                crc >>= 1
-    return (~crc) & 0xFFFF
+PREAMBLE = b'\x55\xFF'
+
+# Preamble, frame type, dest, src, length (big-endian), header CRC
+MSTP_HEADER = struct.Struct('>2sBBBHB')
+
+# Data CRC is sent LSB first
+MSTP_DATA_CRC = struct.Struct('<H')
 
 
 def build_frame(frame_type, dest, src, data=None):
     """Build an MS/TP frame with correct preamble and CRCs."""
-    preamble = bytes([0x55, 0xFF])
-
     if data is None or len(data) == 0:
-        header = bytes([frame_type, dest, src, 0x00, 0x00])
-        header_crc = crc8_header(header)
-        return preamble + header + bytes([header_crc])
-    else:
-        data_len = len(data)
-        header = bytes([frame_type, dest, src, (data_len >> 8) & 0xFF, data_len & 0xFF])
-        header_crc = crc8_header(header)
-        data_crc = crc16_data(data)
-        # Data CRC is sent LSB first
-        return preamble + header + bytes([header_crc]) + bytes(data) + struct.pack('<H', data_crc)
+        header_crc = crc8_header((frame_type, dest, src, 0x00, 0x00))
+        return MSTP_HEADER.pack(PREAMBLE, frame_type, dest, src, 0, header_crc)
 
-
-def timestamp():
-    return datetime.now().strftime('%H:%M:%S.%f')[:-3]
+    # Header, data and data CRC are written straight into one buffer
+    data_len = len(data)
+    frame = bytearray(8 + data_len + 2)
+    MSTP_HEADER.pack_into(frame, 0, PREAMBLE, frame_type, dest, src, data_len, 0)
+    frame[7] = crc8_header(frame[2:7])
+    frame[8:8 + data_len] = data
+    MSTP_DATA_CRC.pack_into(frame, 8 + data_len, crc16_data(data))
+    return frame
 
 
 class MstpSimulator:
     """Simulates an MS/TP master station."""
 
+    LOG_LEVEL = LOG_FRAMES
+
     def __init__(self, ser, mac_address, max_master=127):
         self.ser = ser
         self.mac = mac_address
@@ -129,12 +136,14 @@ class MstpSimulator:
 
         # State
         self.rx_buffer = bytearray()
+        self._rx_read = 0  # parse cursor into rx_buffer; bytes before it are consumed
         self.state = "IDLE"
         self.token_count = 0
         self.frame_count = 0
 
         # Master discovery - track known masters on the bus
         self.known_masters = set()  # Set of discovered MAC addresses
+        self.sorted_masters = []    # Same MACs, kept in ascending order
         self.next_station = None    # Will be computed from known_masters
 
         # Statistics
@@ -143,89 +152,129 @@ class MstpSimulator:
         self.data_frames_received = 0
         self.frames_sent = 0
 
-    def log(self, msg, color=C.RESET):
-        print(f"{color}[{timestamp()}] [{self.state:6s}] {msg}{C.RESET}")
+        # Frames without data depend only on (frame_type, dest); built once each
+        self._frame_cache = {}
+
+    def log(self, msg, color=C.RESET, level=LOG_EVENTS):
+        if level > self.LOG_LEVEL:
+            return
+        sys.stdout.write(f"{color}[{timestamp()}] [{self.state:6s}] {msg}{C.RESET}\n")
 
     def discover_master(self, mac):
         """Record a discovered master station."""
         if mac != self.mac and mac <= self.max_master and mac not in self.known_masters:
             self.known_masters.add(mac)
-            self.log(f"*** DISCOVERED MASTER at MAC {mac} *** (known: {sorted(self.known_masters)})", C.YELLOW)
+            bisect.insort(self.sorted_masters, mac)
+            self.log(f"*** DISCOVERED MASTER at MAC {mac} *** (known: {self.sorted_masters})", C.YELLOW)
             self._update_next_station()
 
     def _update_next_station(self):
         """Compute next_station as the next known master after our MAC."""
-        if not self.known_masters:
+        if not self.sorted_masters:
             self.next_station = None
             return
 
         # Find the next master after our MAC address (wrapping around)
-        masters = sorted(self.known_masters)
-        for m in masters:
-            if m > self.mac:
-                self.next_station = m
-                self.log(f"Updated next_station to {self.next_station}", C.GREEN)
-                return
+        i = bisect.bisect_right(self.sorted_masters, self.mac)
+        if i < len(self.sorted_masters):
+            self.next_station = self.sorted_masters[i]
+            self.log(f"Updated next_station to {self.next_station}", C.GREEN)
+            return
         # Wrap around to the lowest master
-        self.next_station = masters[0]
+        self.next_station = self.sorted_masters[0]
         self.log(f"Updated next_station to {self.next_station} (wrapped)", C.GREEN)
 
     def send_frame(self, frame_type, dest, data=None):
         """Send an MS/TP frame."""
-        frame = build_frame(frame_type, dest, self.mac, data)
+        if data:
+            frame = build_frame(frame_type, dest, self.mac, data)
+        else:
+            key = (frame_type, dest)
+            frame = self._frame_cache.get(key)
+            if frame is None:
+                frame = self._frame_cache[key] = build_frame(frame_type, dest, self.mac)
+        # No flush here: tcdrain() on every frame stalls the receive loop.
+        # The token holder drains once when it hands the token on.
         self.ser.write(frame)
-        self.ser.flush()
         self.frames_sent += 1
-        self.log(f"TX: {FRAME_NAMES.get(frame_type, 'Unknown')} -> {dest} [{frame.hex()}]", C.GREEN)
+        if self.LOG_LEVEL >= LOG_FRAMES:
+            self.log(f"TX: {FRAME_NAMES[frame_type] if frame_type < len(FRAME_NAMES) else 'Unknown'} -> {dest} [{frame.hex()}]", C.GREEN, LOG_FRAMES)
 
     def process_rx(self):
-        """Read and buffer incoming bytes."""
-        if self.ser.in_waiting > 0:
-            data = self.ser.read(self.ser.in_waiting)
-            self.rx_buffer.extend(data)
-            return True
-        return False
+        """Read and buffer incoming bytes.
+
+        Blocks in the driver (up to the port timeout) for the first byte,
+        then drains whatever else has already arrived.
+        """
+        data = self.ser.read(1)
+        if not data:
+            return False
+        self.rx_buffer.extend(data)
+        waiting = self.ser.in_waiting
+        if waiting:
+            self.rx_buffer.extend(self.ser.read(waiting))
+        return True
+
+    # Consumed bytes are only dropped from rx_buffer once the cursor passes this
+    RX_COMPACT_THRESHOLD = 4096
+
+    def _consume(self, pos):
+        """Advance the parse cursor to pos, compacting rx_buffer when worthwhile."""
+        if pos >= len(self.rx_buffer):
+            self.rx_buffer.clear()
+            pos = 0
+        elif pos > self.RX_COMPACT_THRESHOLD:
+            del self.rx_buffer[:pos]
+            pos = 0
+        self._rx_read = pos
+
+    # parse_frame result for a frame dropped on a CRC error: bytes were consumed, so
+    # another frame may already be buffered behind it
+    SKIPPED = ()
 
     def parse_frame(self):
-        """Try to parse a complete frame from the buffer."""
+        """Try to parse a complete frame from the buffer.
+
+        Returns (frame_type, dest, src, data), SKIPPED after a CRC error, or None when
+        more bytes are needed.
+        """
+        buf = self.rx_buffer
+
         # Need at least preamble + header
-        if len(self.rx_buffer) < 8:
+        if len(buf) - self._rx_read < 8:
             return None
 
         # Find preamble
-        preamble_pos = -1
-        for i in range(len(self.rx_buffer) - 1):
-            if self.rx_buffer[i] == 0x55 and self.rx_buffer[i+1] == 0xFF:
-                preamble_pos = i
-                break
+        pos = buf.find(b'\x55\xFF', self._rx_read)
 
-        if preamble_pos < 0:
+        if pos < 0:
             # No valid preamble found, keep last byte
-            if len(self.rx_buffer) > 1:
-                self.rx_buffer = self.rx_buffer[-1:]
+            self._consume(len(buf) - 1)
             return None
 
         # Discard bytes before preamble
-        if preamble_pos > 0:
-            self.rx_buffer = self.rx_buffer[preamble_pos:]
+        self._consume(pos)
+        pos = self._rx_read
 
         # Check we have full header
-        if len(self.rx_buffer) < 8:
+        if len(buf) - pos < 8:
             return None
 
         # Parse header
-        frame_type = self.rx_buffer[2]
-        dest = self.rx_buffer[3]
-        src = self.rx_buffer[4]
-        data_len = (self.rx_buffer[5] << 8) | self.rx_buffer[6]
-        header_crc = self.rx_buffer[7]
-
-        # Validate header CRC
-        calc_crc = crc8_header(self.rx_buffer[2:7])
+        frame_type = buf[pos + 2]
+        dest = buf[pos + 3]
+        src = buf[pos + 4]
+        data_len = (buf[pos + 5] << 8) | buf[pos + 6]
+        header_crc = buf[pos + 7]
+
+        # Validate header CRC, reading the header through a view rather than a copied slice.
+        # Views must be released before rx_buffer is resized, hence the with-blocks.
+        with memoryview(buf) as view:
+            calc_crc = crc8_header(view[pos + 2:pos + 7])
         if calc_crc != header_crc:
             self.log(f"Header CRC error: calc=0x{calc_crc:02X} recv=0x{header_crc:02X}", C.RED)
-            self.rx_buffer = self.rx_buffer[2:]  # Skip preamble, try again
-            return None
+            self._consume(pos + 2)  # Skip preamble, try again
+            return self.SKIPPED
 
         # Calculate total frame size
         if data_len > 0:
@@ -234,34 +283,35 @@ class MstpSimulator:
             frame_size = 8  # header only
 
         # Wait for complete frame
-        if len(self.rx_buffer) < frame_size:
+        if len(buf) - pos < frame_size:
             return None
 
         # Extract data if present
         data = None
         if data_len > 0:
-            data = bytes(self.rx_buffer[8:8+data_len])
+            data_end = pos + 8 + data_len
+            with memoryview(buf) as view:
+                data = bytes(view[pos + 8:data_end])
             # Validate data CRC
-            data_crc_recv = self.rx_buffer[8+data_len] | (self.rx_buffer[8+data_len+1] << 8)
+            data_crc_recv = buf[data_end] | (buf[data_end + 1] << 8)
             data_crc_calc = crc16_data(data)
             if data_crc_recv != data_crc_calc:
                 self.log(f"Data CRC error", C.RED)
-                self.rx_buffer = self.rx_buffer[2:]
-                return None
+                self._consume(pos + 2)
+                return self.SKIPPED
 
         # Remove frame from buffer
-        self.rx_buffer = self.rx_buffer[frame_size:]
+        self._consume(pos + frame_size)
 
         return (frame_type, dest, src, data)
 
     def handle_frame(self, frame_type, dest, src, data):
         """Handle a received frame."""
-        frame_name = FRAME_NAMES.get(frame_type, f"Unknown(0x{frame_type:02X})")
-
         # Only log non-Token frames or tokens for us
-        if frame_type != FRAME_TOKEN or dest == self.mac:
+        if self.LOG_LEVEL >= LOG_FRAMES and (frame_type != FRAME_TOKEN or dest == self.mac):
+            frame_name = FRAME_NAMES[frame_type] if frame_type < len(FRAME_NAMES) else f"Unknown(0x{frame_type:02X})"
             data_info = f" data={data.hex()}" if data else ""
-            self.log(f"RX: {frame_name} {src} -> {dest}{data_info}", C.CYAN)
+            self.log(f"RX: {frame_name} {src} -> {dest}{data_info}", C.CYAN, LOG_FRAMES)
 
         # Discover masters from traffic:
         # - Any frame source is a master (they're actively participating)
@@ -316,7 +366,7 @@ class MstpSimulator:
         # In a real implementation, we'd send any queued BACnet data here
 
         if self.next_station is not None:
-            self.log(f"Passing token to {self.next_station} (known masters: {sorted(self.known_masters)})", C.GREEN)
+            self.log(f"Passing token to {self.next_station} (known masters: {self.sorted_masters})", C.GREEN)
             self.send_frame(FRAME_TOKEN, self.next_station)
         else:
             # No known masters yet - poll for one starting from MAC+1
@@ -326,6 +376,7 @@ class MstpSimulator:
             # Wait for response
             time.sleep(T_USAGE_TIMEOUT)
             # If still no response, just go idle - other masters will pass us token again
+        self.ser.flush()
         self.state = "IDLE"
 
     def run(self):
@@ -337,18 +388,20 @@ class MstpSimulator:
 
         try:
             while True:
-                # Process incoming data
-                self.process_rx()
+                # Wait for incoming data
+                if not self.process_rx():
+                    continue
 
-                # Try to parse frames
+                # Handle every complete frame now buffered
                 frame = self.parse_frame()
-                if frame:
-                    self.handle_frame(*frame)
-
-                # Small delay to prevent CPU spinning
-                time.sleep(0.001)
+                while frame is not None:
+                    if frame is not self.SKIPPED:
+                        self.handle_frame(*frame)
+                    frame = self.parse_frame()
+                sys.stdout.flush()
 
         except KeyboardInterrupt:
+            sys.stdout.flush()
             print(f"\n{C.YELLOW}--- Statistics ---{C.RESET}")
             print(f"Tokens received: {self.tokens_received}")
             print(f"Polls received: {self.polls_received}")
@@ -357,14 +410,17 @@ class MstpSimulator:
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: mstp_simulator.py <serial_port> [baud] [mac_address]")
+    quiet = '-q' in sys.argv
+    args = [arg for arg in sys.argv if arg != '-q']
+
+    if len(args) < 2:
+        print("Usage: mstp_simulator.py <serial_port> [baud] [mac_address] [-q]")
         print("Example: mstp_simulator.py /dev/ttyACM1 38400 4")
         sys.exit(1)
 
-    port = sys.argv[1]
-    baud = int(sys.argv[2]) if len(sys.argv) > 2 else 38400
-    mac = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    port = args[1]
+    baud = int(args[2]) if len(args) > 2 else 38400
+    mac = int(args[3]) if len(args) > 3 else 4
 
     print(f"{C.CYAN}MS/TP Device Simulator{C.RESET}")
     print(f"Port: {port}")
@@ -386,6 +442,8 @@ def main():
         ser.reset_input_buffer()
 
         simulator = MstpSimulator(ser, mac)
+        if quiet:
+            simulator.LOG_LEVEL = LOG_EVENTS
         simulator.run()
 
     except serial.SerialException as e:
@@ -6,82 +6,88 @@ Captures and decodes BACnet MS/TP frames from a serial port.
 Displays frame type, source/destination addresses, and NPDU/APDU content.
 
 Usage:
-    python3 mstp_sniffer.py [port] [baud]
+    python3 mstp_sniffer.py [port] [baud] [-v] [-x] [--no-tokens]
 
 Arguments:
     port - Serial port (default: /dev/ttyUSB0)
     baud - Baud rate (default: 38400)
+    --no-tokens - Don't print Token frames, just report how many were skipped each second
 
 Example:
     python3 mstp_sniffer.py /dev/ttyUSB0 38400
 """
 
+import os
+import select
+import struct
 import sys
 import serial
 import time
-from datetime import datetime
 from collections import deque
 
-# MS/TP Frame Types (from ASHRAE 135 Clause 9)
-FRAME_TYPES = {
-    0x00: "Token",
-    0x01: "Poll-For-Master",
-    0x02: "Reply-To-Poll-For-Master",
-    0x03: "Test_Request",
-    0x04: "Test_Response",
-    0x05: "BACnet-Data-Expecting-Reply",
-    0x06: "BACnet-Data-Not-Expecting-Reply",
-    0x07: "Reply-Postponed",
-}
-
-# BACnet Service Choices (Confirmed)
-CONFIRMED_SERVICES = {
-    0x00: "AcknowledgeAlarm",
-    0x01: "COVNotification",
-    0x02: "EventNotification",
-    0x03: "GetAlarmSummary",
-    0x04: "GetEnrollmentSummary",
-    0x05: "SubscribeCOV",
-    0x06: "AtomicReadFile",
-    0x07: "AtomicWriteFile",
-    0x08: "AddListElement",
-    0x09: "RemoveListElement",
-    0x0A: "CreateObject",
-    0x0B: "DeleteObject",
-    0x0C: "ReadProperty",
-    0x0D: "ReadPropertyConditional",
-    0x0E: "ReadPropertyMultiple",
-    0x0F: "WriteProperty",
-    0x10: "WritePropertyMultiple",
-    0x11: "DeviceCommunicationControl",
-    0x12: "ConfirmedPrivateTransfer",
-    0x13: "ConfirmedTextMessage",
-    0x14: "ReinitializeDevice",
-    0x15: "VTOpen",
-    0x16: "VTClose",
-    0x17: "VTData",
-    0x18: "Authenticate",
-    0x19: "RequestKey",
-    0x1A: "ReadRange",
-    0x1B: "LifeSafetyOperation",
-    0x1C: "SubscribeCOVProperty",
-    0x1D: "GetEventInformation",
-}
-
-# BACnet Service Choices (Unconfirmed)
-UNCONFIRMED_SERVICES = {
-    0x00: "I-Am",
-    0x01: "I-Have",
-    0x02: "COV-Notification",
-    0x03: "Event-Notification",
-    0x04: "Private-Transfer",
-    0x05: "Text-Message",
-    0x06: "Time-Synchronization",
-    0x07: "Who-Has",
-    0x08: "Who-Is",
-    0x09: "UTC-Time-Synchronization",
-    0x0A: "WriteGroup",
-}
+from mstp_crc import crc16_data
+from timestamps import timestamp
+
+# MS/TP Frame Types (from ASHRAE 135 Clause 9), indexed by frame type
+FRAME_TYPES = (
+    "Token",  # 0x00
+    "Poll-For-Master",  # 0x01
+    "Reply-To-Poll-For-Master",  # 0x02
+    "Test_Request",  # 0x03
+    "Test_Response",  # 0x04
+    "BACnet-Data-Expecting-Reply",  # 0x05
+    "BACnet-Data-Not-Expecting-Reply",  # 0x06
+    "Reply-Postponed",  # 0x07
+)
+
+# BACnet Service Choices (Confirmed), indexed by service choice
+CONFIRMED_SERVICES = (
+    "AcknowledgeAlarm",  # 0x00
+    "COVNotification",  # 0x01
+    "EventNotification",  # 0x02
+    "GetAlarmSummary",  # 0x03
+    "GetEnrollmentSummary",  # 0x04
+    "SubscribeCOV",  # 0x05
+    "AtomicReadFile",  # 0x06
+    "AtomicWriteFile",  # 0x07
+    "AddListElement",  # 0x08
+    "RemoveListElement",  # 0x09
+    "CreateObject",  # 0x0A
+    "DeleteObject",  # 0x0B
+    "ReadProperty",  # 0x0C
+    "ReadPropertyConditional",  # 0x0D
+    "ReadPropertyMultiple",  # 0x0E
+    "WriteProperty",  # 0x0F
+    "WritePropertyMultiple",  # 0x10
+    "DeviceCommunicationControl",  # 0x11
+    "ConfirmedPrivateTransfer",  # 0x12
+    "ConfirmedTextMessage",  # 0x13
+    "ReinitializeDevice",  # 0x14
+    "VTOpen",  # 0x15
+    "VTClose",  # 0x16
+    "VTData",  # 0x17
+    "Authenticate",  # 0x18
+    "RequestKey",  # 0x19
+    "ReadRange",  # 0x1A
+    "LifeSafetyOperation",  # 0x1B
+    "SubscribeCOVProperty",  # 0x1C
+    "GetEventInformation",  # 0x1D
+)
+
+# BACnet Service Choices (Unconfirmed), indexed by service choice
+UNCONFIRMED_SERVICES = (
+    "I-Am",  # 0x00
+    "I-Have",  # 0x01
+    "COV-Notification",  # 0x02
+    "Event-Notification",  # 0x03
+    "Private-Transfer",  # 0x04
+    "Text-Message",  # 0x05
+    "Time-Synchronization",  # 0x06
+    "Who-Has",  # 0x07
+    "Who-Is",  # 0x08
+    "UTC-Time-Synchronization",  # 0x09
+    "WriteGroup",  # 0x0A
+)
 
 # Colors for terminal output
 class Colors:
@@ -95,30 +101,41 @@ class Colors:
     WHITE = '\033[97m'
     GRAY = '\033[90m'
 
+# Output is block-buffered and flushed every FLUSH_FRAMES frames or FLUSH_INTERVAL seconds
+FLUSH_FRAMES = 64
+FLUSH_INTERVAL = 0.05
+
+# With --no-tokens, the skipped-token count is reported this often (seconds)
+TOKEN_REPORT_INTERVAL = 1.0
+
+# Frame type, dest, src, length (big-endian), header CRC - starting after the preamble
+MSTP_HEADER = struct.Struct('>BBBHB')
+
+# NPDU DNET/SNET (big-endian) followed by DLEN/SLEN
+NPDU_NETWORK = struct.Struct('>HB')
+
+# APDU PDU type (high nibble of the first octet), indexed by that octet
+PDU_TYPES = bytes(octet >> 4 for octet in range(256))
+
+def _crc8_step(crc):
+    """Shift one byte's worth of bits through the reflected 0x8C polynomial"""
+    for _ in range(8):
+        if crc & 1:
+            crc = (crc >> 1) ^ 0x8C
+        else:
+            crc >>= 1
+    return crc
+
+# Header CRC lookup table, indexed by (crc ^ byte)
+_CRC8_TABLE = bytes(_crc8_step(i) for i in range(256))
+
 def crc8(data):
     """Calculate MS/TP header CRC (CRC-8)"""
     crc = 0xFF
     for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 1:
-                crc = (crc >> 1) ^ 0x8C
-            else:
-                crc >>= 1
+        crc = _CRC8_TABLE[crc ^ byte]
     return crc ^ 0xFF
 
-def crc16(data):
-    """Calculate MS/TP data CRC (CRC-16)"""
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 1:
-                crc = (crc >> 1) ^ 0x8408  # CRC-CCITT (NOT 0xA001 which is MODBUS)
-            else:
-                crc >>= 1
-    return crc ^ 0xFFFF
-
 def decode_npdu(data):
     """Decode BACnet NPDU header"""
     if len(data) < 2:
@@ -144,8 +161,7 @@ def decode_npdu(data):
 
     # Destination network
     if info['dnet_present'] and len(data) > offset + 3:
-        info['dnet'] = (data[offset] << 8) | data[offset + 1]
-        dlen = data[offset + 2]
+        info['dnet'], dlen = NPDU_NETWORK.unpack_from(data, offset)
         info['dlen'] = dlen
         offset += 3
         if dlen > 0 and len(data) > offset + dlen:
@@ -154,8 +170,7 @@ def decode_npdu(data):
 
     # Source network
     if info['snet_present'] and len(data) > offset + 3:
-        info['snet'] = (data[offset] << 8) | data[offset + 1]
-        slen = data[offset + 2]
+        info['snet'], slen = NPDU_NETWORK.unpack_from(data, offset)
         info['slen'] = slen
         offset += 3
         if slen > 0 and len(data) > offset + slen:
@@ -170,62 +185,70 @@ def decode_npdu(data):
     info['apdu_offset'] = offset
     return info, None
 
+def _service_name(services, service):
+    """Name of a service choice from one of the tables above"""
+    return services[service] if service < len(services) else f"Unknown({service})"
+
+def _confirmed_request(data):
+    if len(data) < 4:
+        return "Confirmed Request (truncated)"
+    return f"Confirmed-REQ: {_service_name(CONFIRMED_SERVICES, data[3])}"
+
+def _unconfirmed_request(data):
+    if len(data) < 2:
+        return "Unconfirmed Request (truncated)"
+    return f"Unconfirmed-REQ: {_service_name(UNCONFIRMED_SERVICES, data[1])}"
+
+def _simple_ack(data):
+    if len(data) < 3:
+        return "Simple-ACK (truncated)"
+    return f"Simple-ACK: {_service_name(CONFIRMED_SERVICES, data[2])}"
+
+def _complex_ack(data):
+    if len(data) < 3:
+        return "Complex-ACK (truncated)"
+    return f"Complex-ACK: {_service_name(CONFIRMED_SERVICES, data[2])}"
+
+def _segment_ack(data):
+    return "Segment-ACK"
+
+def _error(data):
+    if len(data) < 3:
+        return "Error (truncated)"
+    return f"Error: {_service_name(CONFIRMED_SERVICES, data[2])}"
+
+def _reject(data):
+    return "Reject"
+
+def _abort(data):
+    return "Abort"
+
+# APDU decoders, indexed by PDU type
+APDU_DECODERS = (
+    _confirmed_request,    # 0x00
+    _unconfirmed_request,  # 0x01
+    _simple_ack,           # 0x02
+    _complex_ack,          # 0x03
+    _segment_ack,          # 0x04
+    _error,                # 0x05
+    _reject,               # 0x06
+    _abort,                # 0x07
+)
+
 def decode_apdu(data):
     """Decode BACnet APDU"""
     if len(data) < 1:
         return "Empty APDU"
 
-    pdu_type = (data[0] >> 4) & 0x0F
-
-    if pdu_type == 0x00:  # Confirmed Request
-        if len(data) < 4:
-            return "Confirmed Request (truncated)"
-        service = data[3]
-        service_name = CONFIRMED_SERVICES.get(service, f"Unknown({service})")
-        return f"Confirmed-REQ: {service_name}"
-
-    elif pdu_type == 0x01:  # Unconfirmed Request
-        if len(data) < 2:
-            return "Unconfirmed Request (truncated)"
-        service = data[1]
-        service_name = UNCONFIRMED_SERVICES.get(service, f"Unknown({service})")
-        return f"Unconfirmed-REQ: {service_name}"
-
-    elif pdu_type == 0x02:  # Simple ACK
-        if len(data) < 3:
-            return "Simple-ACK (truncated)"
-        service = data[2]
-        service_name = CONFIRMED_SERVICES.get(service, f"Unknown({service})")
-        return f"Simple-ACK: {service_name}"
-
-    elif pdu_type == 0x03:  # Complex ACK
-        if len(data) < 3:
-            return "Complex-ACK (truncated)"
-        service = data[2]
-        service_name = CONFIRMED_SERVICES.get(service, f"Unknown({service})")
-        return f"Complex-ACK: {service_name}"
-
-    elif pdu_type == 0x04:  # Segment ACK
-        return "Segment-ACK"
-
-    elif pdu_type == 0x05:  # Error
-        if len(data) < 3:
-            return "Error (truncated)"
-        service = data[2]
-        service_name = CONFIRMED_SERVICES.get(service, f"Unknown({service})")
-        return f"Error: {service_name}"
-
-    elif pdu_type == 0x06:  # Reject
-        return "Reject"
-
-    elif pdu_type == 0x07:  # Abort
-        return "Abort"
+    pdu_type = PDU_TYPES[data[0]]
+    if pdu_type < len(APDU_DECODERS):
+        return APDU_DECODERS[pdu_type](data)
 
     return f"Unknown PDU type: {pdu_type}"
 
 def format_frame(frame_num, frame_type, dst, src, data_len, data, timestamp):
     """Format a decoded MS/TP frame for display"""
-    frame_name = FRAME_TYPES.get(frame_type, f"Unknown({frame_type:02X})")
+    frame_name = FRAME_TYPES[frame_type] if frame_type < len(FRAME_TYPES) else f"Unknown({frame_type:02X})"
 
     # Color based on frame type
     if frame_type == 0x00:  # Token
@@ -264,129 +287,146 @@ def format_frame(frame_num, frame_type, dst, src, data_len, data, timestamp):
 
 def print_hex_dump(data, prefix=""):
     """Print hex dump of data"""
-    hex_str = ' '.join(f'{b:02X}' for b in data)
-    ascii_str = ''.join(chr(b) if 32 <= b < 127 else '.' for b in data)
+    hex_str = data.hex(' ').upper()
     print(f"{Colors.GRAY}{prefix}HEX: {hex_str}{Colors.RESET}")
 
 class MstpSniffer:
-    """MS/TP frame parser state machine"""
+    """MS/TP frame parser working on blocks of received bytes"""
 
-    PREAMBLE1 = 0x55
-    PREAMBLE2 = 0xFF
+    PREAMBLE = b'\x55\xff'
 
-    def __init__(self, verbose=False, show_hex=False):
+    def __init__(self, verbose=False, show_hex=False, skip_tokens=False):
         self.verbose = verbose
         self.show_hex = show_hex
+        self.skip_tokens = skip_tokens
         self.buffer = bytearray()
         self.frame_count = 0
-        self.state = 'IDLE'
-        self.frame_type = 0
-        self.dst_addr = 0
-        self.src_addr = 0
-        self.data_len = 0
-        self.header_crc = 0
-        self.data = bytearray()
-        self.data_crc = 0
-
-    def process_byte(self, byte):
-        """Process a single byte through the state machine"""
-        self.buffer.append(byte)
-
-        if self.state == 'IDLE':
-            if byte == self.PREAMBLE1:
-                self.state = 'PREAMBLE'
-                self.buffer = bytearray([byte])
-            else:
-                self.buffer.clear()
+        self.tokens_skipped = 0  # since the last report
+
+    def feed(self, data):
+        """Parse received bytes and yield (output, hex_data) for each complete frame"""
+        # self.buffer only ever holds the unparsed tail of the previous block;
+        # when there is none, frames are parsed straight out of the new block
+        if self.buffer:
+            self.buffer.extend(data)
+            buf = self.buffer
+        else:
+            buf = data
+        pos = 0
 
-        elif self.state == 'PREAMBLE':
-            if byte == self.PREAMBLE2:
-                self.state = 'HEADER'
-            elif byte == self.PREAMBLE1:
-                pass  # Stay in PREAMBLE
-            else:
-                self.state = 'IDLE'
-                self.buffer.clear()
-
-        elif self.state == 'HEADER':
-            if len(self.buffer) == 8:  # Full header received
-                self.frame_type = self.buffer[2]
-                self.dst_addr = self.buffer[3]
-                self.src_addr = self.buffer[4]
-                self.data_len = (self.buffer[5] << 8) | self.buffer[6]
-                self.header_crc = self.buffer[7]
-
-                # Verify header CRC
-                calc_crc = crc8(self.buffer[2:7])
-                if calc_crc != self.header_crc:
-                    if self.verbose:
-                        print(f"{Colors.RED}[CRC ERROR] Header CRC mismatch: calc={calc_crc:02X} recv={self.header_crc:02X}{Colors.RESET}")
-                    self.state = 'IDLE'
-                    self.buffer.clear()
-                    return None
-
-                if self.data_len > 0:
-                    self.state = 'DATA'
-                    self.data = bytearray()
-                else:
-                    # No data, frame complete
-                    return self._complete_frame()
-
-        elif self.state == 'DATA':
-            self.data.append(byte)
-            if len(self.data) == self.data_len + 2:  # Data + 2-byte CRC
-                self.data_crc = (self.data[-1] << 8) | self.data[-2]
-                self.data = self.data[:-2]
+        while True:
+            pos = buf.find(self.PREAMBLE, pos)
+            if pos < 0:
+                # Keep the last byte: it may be the 0x55 of a preamble split across reads
+                pos = max(len(buf) - 1, 0)
+                break
+            if len(buf) - pos < 8:
+                break
+
+            frame_type, dst_addr, src_addr, data_len, header_crc = MSTP_HEADER.unpack_from(buf, pos + 2)
+
+            # Verify header CRC
+            calc_crc = crc8(buf[pos + 2:pos + 7])
+            if calc_crc != header_crc:
+                if self.verbose:
+                    print(f"{Colors.RED}[CRC ERROR] Header CRC mismatch: calc={calc_crc:02X} recv={header_crc:02X}{Colors.RESET}")
+                pos += 8
+                continue
+
+            if data_len > 0:
+                frame_end = pos + 8 + data_len + 2  # Data + 2-byte CRC
+                if len(buf) < frame_end:
+                    break
+                data = bytes(buf[pos + 8:frame_end - 2])
+                data_crc = (buf[frame_end - 1] << 8) | buf[frame_end - 2]
 
                 # Verify data CRC
-                calc_crc = crc16(self.data)
-                if calc_crc != self.data_crc:
+                calc_crc = crc16_data(data)
+                if calc_crc != data_crc:
                     if self.verbose:
                         print(f"{Colors.RED}[CRC ERROR] Data CRC mismatch{Colors.RESET}")
-
-                return self._complete_frame()
-
-        return None
-
-    def _complete_frame(self):
+            else:
+                # No data, frame complete
+                frame_end = pos + 8
+                data = b''
+
+            pos = frame_end
+            if frame_type == 0x00 and self.skip_tokens:
+                # Tokens are most of the traffic: count them without formatting
+                self.frame_count += 1
+                self.tokens_skipped += 1
+                continue
+            yield self._complete_frame(frame_type, dst_addr, src_addr, data_len, data)
+
+        if buf is self.buffer:
+            del buf[:pos]
+        else:
+            self.buffer += buf[pos:]
+
+    def _complete_frame(self, frame_type, dst_addr, src_addr, data_len, data):
         """Complete frame processing and return formatted output"""
         self.frame_count += 1
-        timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
 
         output = format_frame(
             self.frame_count,
-            self.frame_type,
-            self.dst_addr,
-            self.src_addr,
-            self.data_len,
-            self.data,
-            timestamp
+            frame_type,
+            dst_addr,
+            src_addr,
+            data_len,
+            data,
+            timestamp()
         )
 
-        hex_data = bytes(self.data) if self.data else None
-
-        # Reset state
-        self.state = 'IDLE'
-        self.buffer.clear()
-        self.data = bytearray()
+        hex_data = data if data else None
 
         return output, hex_data
 
+def serial_reader(ser):
+    """Return a function that waits up to the port timeout and returns the bytes received so far"""
+    try:
+        fd = ser.fileno()
+    except (AttributeError, OSError):
+        fd = None
+
+    if fd is None:
+        # No raw descriptor (e.g. Windows): block in pyserial for the first byte,
+        # then drain whatever else has already arrived
+        def read():
+            data = ser.read(1)
+            if data:
+                waiting = ser.in_waiting
+                if waiting:
+                    data += ser.read(waiting)
+            return data
+        return read
+
+    # One select() and one read() per block, straight from the tty
+    def read():
+        ready, _, _ = select.select([fd], [], [], ser.timeout)
+        if not ready:
+            return b''
+        data = os.read(fd, 4096)
+        if not data:
+            raise serial.SerialException('device reports readiness to read but returned no data (device disconnected?)')
+        return data
+    return read
+
 def main():
     port = sys.argv[1] if len(sys.argv) > 1 else '/dev/ttyUSB0'
     baud = int(sys.argv[2]) if len(sys.argv) > 2 else 38400
     verbose = '-v' in sys.argv or '--verbose' in sys.argv
     show_hex = '-x' in sys.argv or '--hex' in sys.argv
+    skip_tokens = '--no-tokens' in sys.argv
 
     print(f"{Colors.CYAN}BACnet MS/TP Sniffer{Colors.RESET}")
     print(f"Port: {port} @ {baud} baud")
     print("=" * 70)
-    print("Options: -v/--verbose for debug, -x/--hex for hex dumps")
+    print("Options: -v/--verbose for debug, -x/--hex for hex dumps, --no-tokens to hide Token frames")
     print("Press Ctrl+C to exit")
     print("=" * 70)
     print()
 
-    sniffer = MstpSniffer(verbose=verbose, show_hex=show_hex)
+    sniffer = MstpSniffer(verbose=verbose, show_hex=show_hex, skip_tokens=skip_tokens)
 
     try:
         ser = serial.Serial(
@@ -401,18 +441,35 @@ def main():
         print(f"{Colors.GREEN}[CONNECTED]{Colors.RESET} {port}")
         print()
 
+        read = serial_reader(ser)
+
+        # A terminal is line-buffered by default: one write() per frame line
+        sys.stdout.reconfigure(line_buffering=False)
+        last_flush = last_token_report = time.monotonic()
+
         while True:
-            if ser.in_waiting > 0:
-                data = ser.read(ser.in_waiting)
-                for byte in data:
-                    result = sniffer.process_byte(byte)
-                    if result:
-                        output, hex_data = result
-                        print(output)
-                        if show_hex and hex_data:
-                            print_hex_dump(hex_data, "  ")
-            else:
-                time.sleep(0.001)
+            data = read()
+            if skip_tokens and sniffer.tokens_skipped:
+                now = time.monotonic()
+                if now - last_token_report >= TOKEN_REPORT_INTERVAL:
+                    print(f"{Colors.GRAY}[skipped {sniffer.tokens_skipped} tokens]{Colors.RESET}")
+                    sniffer.tokens_skipped = 0
+                    last_token_report = now
+            if not data:
+                # Bus idle: show whatever is still buffered
+                sys.stdout.flush()
+                continue
+            for output, hex_data in sniffer.feed(data):
+                print(output)
+                if show_hex and hex_data:
+                    print_hex_dump(hex_data, "  ")
+                if sniffer.frame_count % FLUSH_FRAMES == 0:
+                    sys.stdout.flush()
+                    last_flush = time.monotonic()
+            now = time.monotonic()
+            if now - last_flush >= FLUSH_INTERVAL:
+                sys.stdout.flush()
+                last_flush = now
 
     except serial.SerialException as e:
         print(f"{Colors.RED}[ERROR]{Colors.RESET} Could not open {port}: {e}")
@@ -422,6 +479,8 @@ def main():
         print("  3. For WSL2, use usbipd to attach USB device")
         sys.exit(1)
     except KeyboardInterrupt:
+        if sniffer.tokens_skipped:
+            print(f"{Colors.GRAY}[skipped {sniffer.tokens_skipped} tokens]{Colors.RESET}")
         print(f"\n{Colors.YELLOW}[STOPPED]{Colors.RESET} Captured {sniffer.frame_count} frames")
     finally:
         try:
@@ -6,32 +6,19 @@ Sends Poll-For-Master frames and listens for responses.
 
 import sys
 import serial
-import time
 import struct
 
-def crc8_header(data):
-    """Calculate 8-bit CRC for MS/TP header."""
-    crc = 0xFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 1:
-                crc = (crc >> 1) ^ 0x8C
-            else:
-                crc >>= 1
-    return (~crc) & 0xFF
-
-def crc16_data(data):
-    """Calculate 16-bit CRC for MS/TP data."""
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 1:
-                crc = (crc >> 1) ^ 0x8408  # CRC-CCITT (NOT 0xA001 which is MODBUS)
-            else:
-                crc >>= 1
-    return (~crc) & 0xFFFF
+from mstp_crc import crc8_header, crc16_data
+
+# Seconds per read while listening for traffic
+LISTEN_WINDOW = 0.1
+
+# Seconds to wait for a Reply-To-Poll-For-Master (Treply_delay is at most 250 ms,
+# real stations answer within a few ms)
+POLL_REPLY_TIMEOUT = 0.05
+
+# Reply-To-Poll-For-Master frames carry no data: preamble + header + CRC
+REPLY_FRAME_LEN = 8
 
 def build_mstp_frame(frame_type, dest_addr, src_addr, data=None):
     """Build an MS/TP frame."""
@@ -74,19 +61,25 @@ def decode_frame_type(ft):
     return types.get(ft, f"Unknown(0x{ft:02X})")
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: mstp_test_sender.py <serial_port> [baud_rate] [our_mac]")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
+    verbose = '-v' in sys.argv or '--verbose' in sys.argv
+    if not args:
+        print("Usage: mstp_test_sender.py <serial_port> [baud_rate] [our_mac] [-v]")
+        print("  -v/--verbose  hex dump every frame sent and every read")
         print("Example: mstp_test_sender.py /dev/ttyUSB0 38400 1")
         sys.exit(1)
 
-    port = sys.argv[1]
-    baud = int(sys.argv[2]) if len(sys.argv) > 2 else 38400
-    our_mac = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    port = args[0]
+    baud = int(args[1]) if len(args) > 1 else 38400
+    our_mac = int(args[2]) if len(args) > 2 else 1
 
     print(f"Opening {port} at {baud} baud, our MAC address: {our_mac}")
 
     try:
         ser = serial.Serial(port, baud, timeout=0.5)
+        if hasattr(ser, 'set_buffer_size'):
+            # Windows only: the default driver queue is small for a busy bus
+            ser.set_buffer_size(rx_size=65536)
         ser.reset_input_buffer()
         print(f"Port opened successfully")
     except Exception as e:
@@ -96,56 +89,77 @@ def main():
     print("\n=== MS/TP Test Sender ===")
     print("This will send Poll-For-Master frames and listen for responses.\n")
 
-    # Poll for masters at addresses 0-31
-    for dest in range(0, 32):
-        if dest == our_mac:
-            continue
-
-        # Build Poll-For-Master frame
-        frame = build_mstp_frame(0x01, dest, our_mac)
+    # Build the Poll-For-Master frames for addresses 0-31 up front
+    poll_frames = {dest: build_mstp_frame(0x01, dest, our_mac) for dest in range(0, 32) if dest != our_mac}
 
-        print(f"Sending Poll-For-Master to address {dest}: {frame.hex()}")
+    # Poll for masters. No fixed sleeps: each read returns as soon as a whole reply frame
+    # is in, and only a silent address waits out the full reply timeout.
+    ser.timeout = POLL_REPLY_TIMEOUT
+    masters = []
+    for dest, frame in poll_frames.items():
+        if verbose:
+            print(f"Sending Poll-For-Master to address {dest}: {frame.hex()}")
+        else:
+            print(f"Sending Poll-For-Master to address {dest}")
         ser.write(frame)
         ser.flush()
 
-        # Wait for response (Reply-To-Poll-For-Master should come within Treply_delay)
-        time.sleep(0.050)  # 50ms wait for reply
-
-        # Check for response
-        response = ser.read(100)
+        # Check for response (Reply-To-Poll-For-Master should come within Treply_delay)
+        response = ser.read(REPLY_FRAME_LEN)
         if response:
-            print(f"  RESPONSE: {response.hex()}")
-            # Try to parse it (MS/TP preamble is 55 FF)
-            if len(response) >= 8 and response[0] == 0x55 and response[1] == 0xFF:
-                ft = response[2]
-                da = response[3]
-                sa = response[4]
+            response += ser.read(ser.in_waiting)
+            # Try to parse it (MS/TP preamble is 55 FF); without -v the raw bytes
+            # are only shown when there is no frame to decode
+            i = response.find(b'\x55\xff')
+            decoded = 0 <= i <= len(response) - REPLY_FRAME_LEN
+            if verbose or not decoded:
+                print(f"  RESPONSE: {response.hex()}")
+            if decoded:
+                ft = response[i+2]
+                da = response[i+3]
+                sa = response[i+4]
                 print(f"  -> Frame Type: {decode_frame_type(ft)}, Dest: {da}, Src: {sa}")
+            # Match the reply to the poll by its source address; other stations'
+            # traffic can share the same read
+            if bytes((0x55, 0xFF, 0x02, our_mac, dest)) in response:
+                masters.append(dest)
         else:
             print(f"  (no response)")
 
-        time.sleep(0.010)  # Small delay between polls
+    print(f"\nMasters that replied: {masters if masters else 'none'}")
 
     print("\n=== Listening for traffic ===")
     print("Press Ctrl+C to exit\n")
 
+    # Report what arrived in each listening window, in one read of up to 2 KiB
+    ser.timeout = LISTEN_WINDOW
+
+    # Unconsumed end of the previous read: a preamble or header split across reads
+    tail = b''
+
     try:
         while True:
-            data = ser.read(100)
+            data = ser.read(2048)
             if data:
-                print(f"Received: {data.hex()}")
+                if verbose:
+                    print(f"Received: {data.hex()}")
                 # Try to find frame sync (MS/TP preamble is 55 FF)
-                i = 0
-                while i < len(data) - 1:
-                    if data[i] == 0x55 and data[i+1] == 0xFF:
-                        if i + 7 < len(data):
-                            ft = data[i+2]
-                            da = data[i+3]
-                            sa = data[i+4]
-                            dlen = (data[i+5] << 8) | data[i+6]
-                            print(f"  -> {decode_frame_type(ft)}: {sa} -> {da}, len={dlen}")
-                        break
-                    i += 1
+                buf = tail + data
+                i = buf.find(b'\x55\xff')
+                if i < 0:
+                    if not verbose:
+                        # Nothing to decode: show the raw bytes instead
+                        print(f"Received: {data.hex()}")
+                    tail = buf[-1:]
+                elif i + 7 < len(buf):
+                    ft = buf[i+2]
+                    da = buf[i+3]
+                    sa = buf[i+4]
+                    dlen = (buf[i+5] << 8) | buf[i+6]
+                    print(f"  -> {decode_frame_type(ft)}: {sa} -> {da}, len={dlen}")
+                    tail = b''
+                else:
+                    tail = buf[i:]
     except KeyboardInterrupt:
         print("\nExiting...")
     finally:
@@ -39,24 +39,31 @@ def main():
             stopbits=serial.STOPBITS_ONE
         )
 
+        if hasattr(ser, 'set_buffer_size'):
+            # Windows only: the default driver queue is small for a chatty device
+            ser.set_buffer_size(rx_size=65536)
+
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Connected to {port}")
         print()
 
         while True:
             try:
-                # Read available data
-                if ser.in_waiting > 0:
-                    data = ser.read(ser.in_waiting)
-                    try:
-                        text = data.decode('utf-8', errors='replace')
-                        # Print without extra newlines (ESP-IDF already includes them)
-                        sys.stdout.write(text)
-                        sys.stdout.flush()
-                    except Exception as e:
-                        # Print as hex if decode fails
-                        print(f"[HEX] {data.hex()}")
-                else:
-                    time.sleep(0.01)  # Small delay to prevent CPU spinning
+                # Block in the driver (up to the port timeout) for the first byte,
+                # then take everything else already received in the same read
+                data = ser.read(1)
+                if not data:
+                    continue
+                waiting = ser.in_waiting
+                if waiting:
+                    data += ser.read(waiting)
+                try:
+                    text = data.decode('utf-8', errors='replace')
+                    # Print without extra newlines (ESP-IDF already includes them)
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+                except Exception as e:
+                    # Print as hex if decode fails
+                    print(f"[HEX] {data.hex()}")
 
             except serial.SerialException as e:
                 print(f"\n[ERROR] Serial error: {e}")
@@ -21,9 +21,20 @@ import socket
 import struct
 import time
 import argparse
+import asyncio
+import contextvars
+import functools
 import sys
-from datetime import datetime
 from collections import defaultdict
+from dataclasses import dataclass, replace
+
+from bacnet_udp import enlarge_socket_buffers
+from timestamps import timestamp
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Configuration
 DEFAULT_GATEWAY_IP = "192.168.86.141"
@@ -62,17 +73,50 @@ PROP_DESCRIPTION = 28
 # Test results tracking
 test_results = {}
 
+# BVLC header: type, function, length
+_BVLC = struct.Struct('>BBH')
+# Read-FDT-Ack entry: IP, port, TTL, seconds remaining
+_FDT_ENTRY = struct.Struct('>4sHHH')
+# DNET/SNET and the address length that follows it
+_NET_ADDR = struct.Struct('>HB')
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+# ReadProperty APDU header and object identifier, then a 1- or 2-byte property identifier
+_READ_PROPERTY_8 = struct.Struct('>5BI2B')
+_READ_PROPERTY_16 = struct.Struct('>5BIBH')
+
+
+# Lines logged by the test running in this task, printed as one block when it finishes
+_log_lines = contextvars.ContextVar('_log_lines', default=None)
+
 
 def log(msg, level="INFO"):
-    ts = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-    print(f"[{ts}] {level}: {msg}")
+    line = f"[{timestamp()}] {level}: {msg}"
+    lines = _log_lines.get()
+    if lines is None:
+        print(line)
+    else:
+        lines.append(line)
 
 
 def build_bvlc(npdu, is_broadcast=False):
     """Wrap NPDU in BVLC"""
     func = BVLC_ORIGINAL_BROADCAST if is_broadcast else BVLC_ORIGINAL_UNICAST
-    length = 4 + len(npdu)
-    return bytes([0x81, func, (length >> 8) & 0xFF, length & 0xFF]) + npdu
+    return _BVLC.pack(0x81, func, 4 + len(npdu)) + npdu
+
+
+# Windows sockets have no sendmsg
+_HAVE_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+
+def send_bvlc(sock, addr, *parts, is_broadcast=False):
+    """Send NPDU parts wrapped in BVLC, letting the kernel gather them instead of joining them here"""
+    func = BVLC_ORIGINAL_BROADCAST if is_broadcast else BVLC_ORIGINAL_UNICAST
+    header = _BVLC.pack(0x81, func, 4 + sum(map(len, parts)))
+    if _HAVE_SENDMSG:
+        sock.sendmsg((header,) + parts, (), 0, addr)
+    else:
+        sock.sendto(header + b''.join(parts), addr)
 
 
 def build_npdu(apdu=None, dnet=None, dadr=None, expecting_reply=False, network_msg=None):
@@ -85,24 +129,30 @@ def build_npdu(apdu=None, dnet=None, dadr=None, expecting_reply=False, network_m
     if network_msg is not None:
         control |= 0x80
 
-    npdu = bytes([0x01, control])
+    # Built up in place rather than by concatenating a new bytes object per field
+    npdu = bytearray((0x01, control))
 
     if dnet is not None:
-        npdu += struct.pack('>H', dnet)
+        npdu += _NET_ADDR.pack(dnet, len(dadr) if dadr else 0)
         if dadr:
-            npdu += bytes([len(dadr)]) + dadr
-        else:
-            npdu += bytes([0])
-        npdu += bytes([0xFF])
+            npdu += dadr
+        npdu.append(0xFF)
 
     if network_msg is not None:
-        npdu += bytes([network_msg])
+        npdu.append(network_msg)
     elif apdu:
         npdu += apdu
 
-    return npdu
+    return bytes(npdu)
+
 
+@functools.lru_cache(maxsize=256)
+def build_routed_npdu(dnet, mac):
+    """NPDU for a confirmed request to one MAC on a remote network, built once per destination"""
+    return build_npdu(dnet=dnet, dadr=bytes([mac]), expecting_reply=True)
 
+
+@functools.lru_cache(maxsize=256)
 def build_who_is(low=None, high=None):
     """Build Who-Is APDU"""
     apdu = bytes([0x10, SERVICE_WHO_IS])
@@ -118,35 +168,75 @@ def build_who_is(low=None, high=None):
     return apdu
 
 
-def build_read_property(invoke_id, device_instance, property_id):
-    """Build ReadProperty APDU"""
+@functools.lru_cache(maxsize=256)
+def _read_property_template(device_instance, property_id):
+    """ReadProperty APDU with invoke ID 0, built once per device and property"""
     obj_id = (8 << 22) | device_instance
-    apdu = bytes([0x00, 0x05, invoke_id, SERVICE_READ_PROPERTY, 0x0C])
-    apdu += struct.pack('>I', obj_id)
+    # PDU header, object identifier and property identifier tag in one pack
     if property_id <= 255:
-        apdu += bytes([0x19, property_id])
-    else:
-        apdu += bytes([0x1A, (property_id >> 8) & 0xFF, property_id & 0xFF])
-    return apdu
+        return _READ_PROPERTY_8.pack(0x00, 0x05, 0, SERVICE_READ_PROPERTY, 0x0C,
+                                     obj_id, 0x19, property_id)
+    return _READ_PROPERTY_16.pack(0x00, 0x05, 0, SERVICE_READ_PROPERTY, 0x0C,
+                                  obj_id, 0x1A, property_id & 0xFFFF)
 
 
+def build_read_property(invoke_id, device_instance, property_id):
+    """Build ReadProperty APDU"""
+    # Only the invoke ID (APDU byte 2) changes between requests
+    apdu = bytearray(_read_property_template(device_instance, property_id))
+    apdu[2] = invoke_id
+    return bytes(apdu)
+
+
+@functools.lru_cache(maxsize=256)
 def build_who_is_router(target_network=None):
     """Build Who-Is-Router-To-Network message"""
     npdu = build_npdu(network_msg=NL_WHO_IS_ROUTER)
     if target_network is not None:
-        npdu += struct.pack('>H', target_network)
+        npdu += _U16.pack(target_network)
     return npdu
 
 
 def build_register_fd(ttl_seconds):
     """Build Register-Foreign-Device BVLC"""
-    return bytes([0x81, BVLC_REGISTER_FD, 0x00, 0x06,
-                  (ttl_seconds >> 8) & 0xFF, ttl_seconds & 0xFF])
+    return _BVLC.pack(0x81, BVLC_REGISTER_FD, 6) + _U16.pack(ttl_seconds & 0xFFFF)
 
 
 def build_read_fdt():
     """Build Read-Foreign-Device-Table BVLC"""
-    return bytes([0x81, BVLC_READ_FDT, 0x00, 0x04])
+    return _BVLC.pack(0x81, BVLC_READ_FDT, 4)
+
+
+@dataclass(slots=True)
+class Response:
+    """A parsed gateway response; NPDU fields are None when the packet has no NPDU"""
+    bvlc_func: int
+    bvlc_len: int
+    type: str | None = None
+    # NPDU
+    control: int | None = None
+    network_msg: bool = False
+    dnet: int | None = None
+    dadr: bytes | None = None
+    snet: int | None = None
+    sadr: bytes | None = None
+    hop_count: int | None = None
+    network_msg_type: int | None = None
+    networks: list | None = None
+    rejected_net: int | None = None
+    # APDU
+    apdu: bytes | None = None
+    service: int | None = None
+    device_instance: int | None = None
+    invoke_id: int | None = None
+    reason: int | None = None
+    # BVLC-Result / Read-FDT-Ack
+    result_code: int | None = None
+    fdt_entries: list | None = None
+    # Filled in by receive_until
+    raw: bytes | None = None
+    addr: tuple | None = None
+    time: float | None = None
 
 
 def parse_response(data):
@@ -154,188 +244,331 @@ def parse_response(data):
     if len(data) < 4 or data[0] != 0x81:
         return None
 
-    result = {
-        'bvlc_func': data[1],
-        'bvlc_len': (data[2] << 8) | data[3],
-        'npdu': None,
-        'apdu': None,
-        'type': None
-    }
+    _, bvlc_func, bvlc_len = _BVLC.unpack_from(data)
+    result = Response(bvlc_func, bvlc_len)
 
     # Handle different BVLC functions
-    if result['bvlc_func'] == BVLC_RESULT:
-        result['type'] = 'bvlc_result'
-        result['result_code'] = (data[4] << 8) | data[5] if len(data) >= 6 else 0
+    if bvlc_func == BVLC_RESULT:
+        result.type = 'bvlc_result'
+        result.result_code = _U16.unpack_from(data, 4)[0] if len(data) >= 6 else 0
         return result
 
-    if result['bvlc_func'] == BVLC_READ_FDT_ACK:
-        result['type'] = 'fdt_ack'
-        result['fdt_entries'] = []
-        pos = 4
-        while pos + 10 <= len(data):
-            ip = f"{data[pos]}.{data[pos+1]}.{data[pos+2]}.{data[pos+3]}"
-            port = (data[pos+4] << 8) | data[pos+5]
-            ttl = (data[pos+6] << 8) | data[pos+7]
-            remaining = (data[pos+8] << 8) | data[pos+9]
-            result['fdt_entries'].append({
-                'address': f"{ip}:{port}",
+    if bvlc_func == BVLC_READ_FDT_ACK:
+        result.type = 'fdt_ack'
+        # iter_unpack wants a whole number of entries; a trailing partial one is ignored
+        end = 4 + (len(data) - 4) // _FDT_ENTRY.size * _FDT_ENTRY.size
+        result.fdt_entries = [
+            {
+                'address': f"{ip[0]}.{ip[1]}.{ip[2]}.{ip[3]}:{port}",
                 'ttl': ttl,
                 'remaining': remaining
-            })
-            pos += 10
+            }
+            for ip, port, ttl, remaining in _FDT_ENTRY.iter_unpack(memoryview(data)[4:end])
+        ]
         return result
 
-    npdu_start = 4
-    if result['bvlc_func'] == BVLC_FORWARDED_NPDU:
-        npdu_start = 10
+    # Offsets below index data directly rather than a copied NPDU slice
+    pos = 4
+    if bvlc_func == BVLC_FORWARDED_NPDU:
+        pos = 10
 
-    if len(data) < npdu_start + 2:
+    end = len(data)
+    if end < pos + 2:
         return result
 
-    npdu_data = data[npdu_start:]
-    control = npdu_data[1]
-    pos = 2
+    control = data[pos + 1]
+    pos += 2
 
-    result['npdu'] = {
-        'control': control,
-        'network_msg': bool(control & 0x80),
-        'dnet': None, 'dadr': None,
-        'snet': None, 'sadr': None,
-        'hop_count': None
-    }
+    result.control = control
+    result.network_msg = bool(control & 0x80)
 
     if control & 0x20:
-        if pos + 3 <= len(npdu_data):
-            result['npdu']['dnet'] = (npdu_data[pos] << 8) | npdu_data[pos+1]
-            dlen = npdu_data[pos+2]
+        if pos + 3 <= end:
+            result.dnet, dlen = _NET_ADDR.unpack_from(data, pos)
             pos += 3
-            if dlen > 0 and pos + dlen <= len(npdu_data):
-                result['npdu']['dadr'] = npdu_data[pos:pos+dlen]
+            if dlen > 0 and pos + dlen <= end:
+                result.dadr = data[pos:pos+dlen]
                 pos += dlen
 
     if control & 0x08:
-        if pos + 3 <= len(npdu_data):
-            result['npdu']['snet'] = (npdu_data[pos] << 8) | npdu_data[pos+1]
-            slen = npdu_data[pos+2]
+        if pos + 3 <= end:
+            result.snet, slen = _NET_ADDR.unpack_from(data, pos)
             pos += 3
-            if slen > 0 and pos + slen <= len(npdu_data):
-                result['npdu']['sadr'] = npdu_data[pos:pos+slen]
+            if slen > 0 and pos + slen <= end:
+                result.sadr = data[pos:pos+slen]
                 pos += slen
 
-    if control & 0x20 and pos < len(npdu_data):
-        result['npdu']['hop_count'] = npdu_data[pos]
+    if control & 0x20 and pos < end:
+        result.hop_count = data[pos]
         pos += 1
 
-    if result['npdu']['network_msg']:
-        if pos < len(npdu_data):
-            msg_type = npdu_data[pos]
-            result['type'] = 'network_msg'
-            result['network_msg_type'] = msg_type
+    if result.network_msg:
+        if pos < end:
+            msg_type = data[pos]
+            result.type = 'network_msg'
+            result.network_msg_type = msg_type
             if msg_type == NL_I_AM_ROUTER:
-                result['networks'] = []
                 pos += 1
-                while pos + 2 <= len(npdu_data):
-                    net = (npdu_data[pos] << 8) | npdu_data[pos+1]
-                    result['networks'].append(net)
-                    pos += 2
-    elif pos < len(npdu_data):
-        apdu = npdu_data[pos:]
-        result['apdu'] = apdu
+                stop = pos + (end - pos) // 2 * 2  # whole network numbers only
+                result.networks = [net for (net,) in _U16.iter_unpack(memoryview(data)[pos:stop])]
+            elif msg_type == NL_REJECT_MESSAGE and pos + 4 <= end:
+                result.reason = data[pos + 1]
+                result.rejected_net = _U16.unpack_from(data, pos + 2)[0]
+    elif pos < end:
+        apdu = data[pos:]
+        result.apdu = apdu
         pdu_type = (apdu[0] >> 4) & 0x0F
 
         if pdu_type == 1:  # Unconfirmed
-            result['type'] = 'unconfirmed'
-            result['service'] = apdu[1] if len(apdu) > 1 else None
-            if result['service'] == SERVICE_I_AM and len(apdu) >= 6:
-                obj_id = struct.unpack('>I', apdu[3:7])[0]
-                result['device_instance'] = obj_id & 0x3FFFFF
+            result.type = 'unconfirmed'
+            result.service = apdu[1] if len(apdu) > 1 else None
+            if result.service == SERVICE_I_AM and len(apdu) >= 6:
+                obj_id = _U32.unpack_from(apdu, 3)[0]
+                result.device_instance = obj_id & 0x3FFFFF
         elif pdu_type == 3:  # Complex-ACK
-            result['type'] = 'complex_ack'
-            result['invoke_id'] = apdu[1] if len(apdu) > 1 else None
-            result['service'] = apdu[2] if len(apdu) > 2 else None
+            result.type = 'complex_ack'
+            result.invoke_id = apdu[1] if len(apdu) > 1 else None
+            result.service = apdu[2] if len(apdu) > 2 else None
         elif pdu_type == 5:  # Error
-            result['type'] = 'error'
-            result['invoke_id'] = apdu[1] if len(apdu) > 1 else None
-            result['service'] = apdu[2] if len(apdu) > 2 else None
+            result.type = 'error'
+            result.invoke_id = apdu[1] if len(apdu) > 1 else None
+            result.service = apdu[2] if len(apdu) > 2 else None
         elif pdu_type == 6:  # Reject
-            result['type'] = 'reject'
-            result['invoke_id'] = apdu[1] if len(apdu) > 1 else None
-            result['reason'] = apdu[2] if len(apdu) > 2 else None
+            result.type = 'reject'
+            result.invoke_id = apdu[1] if len(apdu) > 1 else None
+            result.reason = apdu[2] if len(apdu) > 2 else None
 
     return result
 
 
-def receive_until(sock, timeout, stop_condition=None):
-    """Receive responses until timeout or stop condition"""
-    responses = []
-    start = time.time()
-    sock.settimeout(0.5)
+# Columns filled in by parse_responses_bulk; -1 marks a field the packet doesn't carry
+BULK_FIELDS = ('bvlc_func', 'bvlc_len', 'control', 'dnet', 'snet', 'hop_count',
+               'apdu_offset', 'pdu_type', 'service', 'invoke_id')
+
+
+def _bulk_row(data):
+    """parse_response reduced to the BULK_FIELDS columns, for when NumPy is not installed"""
+    row = dict.fromkeys(BULK_FIELDS, -1)
+    resp = parse_response(data)
+    if resp is None:
+        return row
+    row['bvlc_func'] = resp.bvlc_func
+    row['bvlc_len'] = resp.bvlc_len
+    for key in ('control', 'dnet', 'snet', 'hop_count'):
+        if getattr(resp, key) is not None:
+            row[key] = getattr(resp, key)
+    apdu = resp.apdu
+    if apdu:
+        row['apdu_offset'] = len(data) - len(apdu)
+        row['pdu_type'] = apdu[0] >> 4
+        for key in ('service', 'invoke_id'):
+            if getattr(resp, key) is not None:
+                row[key] = getattr(resp, key)
+    return row
+
+
+def parse_responses_bulk(packets):
+    """Decode the fixed header fields of many datagrams at once (e.g. a replayed capture)
+
+    Returns a dict of BULK_FIELDS columns, one entry per packet, matching what
+    parse_response reports for each. With NumPy every column is worked out for all
+    packets in one array operation; the variable-length parts (FDT entries,
+    network lists, APDU bodies) are left to parse_response via 'apdu_offset'.
+    """
+    if np is None:
+        rows = [_bulk_row(data) for data in packets]
+        return {key: [row[key] for row in rows] for key in BULK_FIELDS}
+
+    count = len(packets)
+    lengths = np.fromiter(map(len, packets), dtype=np.int64, count=count)
+    width = max(int(lengths.max()) if count else 0, 4) + 1
+    # Zero-padded (N, width) matrix, at least a BVLC header wide; the extra column
+    # keeps every gather below in range
+    buf = np.zeros((count, width), dtype=np.uint8)
+    for i, data in enumerate(packets):
+        buf[i, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+    buf = buf.astype(np.int64)
+    rows = np.arange(count)
+
+    def at(pos):
+        return buf[rows, np.minimum(pos, width - 1)]
+
+    def u16(pos):
+        return (at(pos) << 8) | at(pos + 1)
+
+    def column(mask, values):
+        return np.where(mask, values, -1)
+
+    valid = (lengths >= 4) & (buf[:, 0] == 0x81)
+    bvlc_func = buf[:, 1]
+    start = np.where(bvlc_func == BVLC_FORWARDED_NPDU, 10, 4)
+    has_npdu = (valid & (bvlc_func != BVLC_RESULT) & (bvlc_func != BVLC_READ_FDT_ACK)
+                & (lengths >= start + 2))
+    control = at(start + 1)
+    pos = start + 2
+
+    has_dnet = has_npdu & ((control & 0x20) != 0) & (pos + 3 <= lengths)
+    dnet = u16(pos)
+    dlen = at(pos + 2)
+    pos = pos + 3 * has_dnet
+    pos = pos + np.where(has_dnet & (dlen > 0) & (pos + dlen <= lengths), dlen, 0)
+
+    has_snet = has_npdu & ((control & 0x08) != 0) & (pos + 3 <= lengths)
+    snet = u16(pos)
+    slen = at(pos + 2)
+    pos = pos + 3 * has_snet
+    pos = pos + np.where(has_snet & (slen > 0) & (pos + slen <= lengths), slen, 0)
+
+    has_hop = has_npdu & ((control & 0x20) != 0) & (pos < lengths)
+    hop_count = at(pos)
+    pos = pos + has_hop
+
+    has_apdu = has_npdu & ((control & 0x80) == 0) & (pos < lengths)
+    pdu_type = at(pos) >> 4
+    second = has_apdu & (pos + 1 < lengths)
+    third = has_apdu & (pos + 2 < lengths)
+    # Unconfirmed carries the service in byte 1; ACK/Error/Reject carry the invoke ID there
+    has_invoke = (pdu_type == 3) | (pdu_type == 5) | (pdu_type == 6)
+    service = np.where(pdu_type == 1, column(second, at(pos + 1)),
+                       np.where((pdu_type == 3) | (pdu_type == 5), column(third, at(pos + 2)), -1))
+
+    return {
+        'bvlc_func': column(valid, bvlc_func),
+        'bvlc_len': column(valid, u16(2)),
+        'control': column(has_npdu, control),
+        'dnet': column(has_dnet, dnet),
+        'snet': column(has_snet, snet),
+        'hop_count': column(has_hop, hop_count),
+        'apdu_offset': column(has_apdu, pos),
+        'pdu_type': column(has_apdu, pdu_type),
+        'service': column(has_apdu, service),
+        'invoke_id': column(has_apdu & has_invoke & second, at(pos + 1)),
+    }
 
-    while time.time() - start < timeout:
-        try:
-            data, addr = sock.recvfrom(1500)
-            resp = parse_response(data)
-            if resp:
-                resp['raw'] = data
-                resp['addr'] = addr
-                resp['time'] = time.time() - start
-                responses.append(resp)
-                if stop_condition and stop_condition(resp):
-                    break
-        except socket.timeout:
-            continue
 
-    return responses
+class BacnetClient(asyncio.DatagramProtocol):
+    """UDP endpoint shared by all tests: each reply is handed to every test still listening,
+    and a confirmed-service reply also resolves the future waiting on its invoke ID"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.listeners = set()
+        self.pending = {}  # invoke ID -> future for its reply
+
+    def datagram_received(self, data, addr):
+        resp = parse_response(data)
+        if resp:
+            resp.raw = data
+            resp.addr = addr
+            for listener in list(self.listeners):
+                listener(resp)
+            if resp.invoke_id is not None:
+                future = self.pending.pop(resp.invoke_id, None)
+                if future and not future.done():
+                    future.set_result(resp)
+
+    def send_bvlc(self, addr, *parts, is_broadcast=False):
+        send_bvlc(self.sock, addr, *parts, is_broadcast=is_broadcast)
+
+    def sendto(self, packet, addr):
+        self.sock.sendto(packet, addr)
+
+    async def receive_until(self, timeout, stop_condition=None):
+        """Receive responses until timeout or stop condition"""
+        responses = []
+        start = time.time()
+        done = asyncio.get_running_loop().create_future()
+
+        def listener(resp):
+            # Other tests see the same response, so 'time' goes on a copy
+            resp = replace(resp, time=time.time() - start)
+            responses.append(resp)
+            if stop_condition and stop_condition(resp) and not done.done():
+                done.set_result(None)
+
+        self.listeners.add(listener)
+        try:
+            await asyncio.wait_for(done, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.listeners.discard(listener)
+
+        return responses
+
+    async def wait_for_reply(self, invoke_id, timeout):
+        """Complex-ACK, Error or Reject for invoke_id, or None on timeout"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending[invoke_id] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.pending.pop(invoke_id, None)
+
+
+async def run_test(test, *args):
+    """Run one test as a task, printing its log lines together once it finishes;
+    an exception fails that test rather than the tests running alongside it"""
+    lines = []
+    _log_lines.set(lines)
+    try:
+        return await test(*args)
+    except Exception as e:
+        log(f"  FAIL: {type(e).__name__}: {e}")
+        return False, None
+    finally:
+        print()
+        print("\n".join(lines))
 
 
 # =============================================================================
 # TEST FUNCTIONS
 # =============================================================================
 
-def test_who_is_global(sock, gateway):
+async def test_who_is_global(client, gateway):
     """Test 1: Global Who-Is broadcast"""
     log("TEST 1: Who-Is Global Broadcast (DNET=0xFFFF)")
 
     apdu = build_who_is()
-    npdu = build_npdu(apdu, dnet=0xFFFF)
-    packet = build_bvlc(npdu, is_broadcast=True)
+    npdu = build_npdu(dnet=0xFFFF)
 
-    sock.sendto(packet, gateway)
-    responses = receive_until(sock, 5)
+    client.send_bvlc(gateway, npdu, apdu, is_broadcast=True)
+    responses = await client.receive_until(5)
 
-    devices = [r for r in responses if r.get('type') == 'unconfirmed'
-               and r.get('service') == SERVICE_I_AM]
+    devices = [r for r in responses if r.type == 'unconfirmed'
+               and r.service == SERVICE_I_AM]
 
-    mstp_devices = [r for r in devices if r.get('npdu', {}).get('snet') == MSTP_NETWORK]
+    mstp_devices = [r for r in devices if r.snet == MSTP_NETWORK]
 
     if mstp_devices:
         log(f"  PASS: Found {len(mstp_devices)} MS/TP device(s) via routing")
         for d in mstp_devices:
-            mac = d['npdu']['sadr'][0] if d['npdu'].get('sadr') else '?'
-            log(f"    - Device {d.get('device_instance')} on MAC {mac}")
+            mac = d.sadr[0] if d.sadr else '?'
+            log(f"    - Device {d.device_instance} on MAC {mac}")
         return True, mstp_devices
     else:
         log(f"  FAIL: No MS/TP devices discovered (got {len(devices)} total)")
         return False, devices
 
 
-def test_who_is_router(sock, gateway):
+async def test_who_is_router(client, gateway):
     """Test 2: Who-Is-Router-To-Network"""
     log("TEST 2: Who-Is-Router-To-Network")
 
     # Ask for router to MS/TP network
     npdu = build_who_is_router(MSTP_NETWORK)
-    packet = build_bvlc(npdu, is_broadcast=True)
 
-    sock.sendto(packet, gateway)
-    responses = receive_until(sock, 3)
+    client.send_bvlc(gateway, npdu, is_broadcast=True)
+    responses = await client.receive_until(3)
 
-    routers = [r for r in responses if r.get('type') == 'network_msg'
-               and r.get('network_msg_type') == NL_I_AM_ROUTER]
+    routers = [r for r in responses if r.type == 'network_msg'
+               and r.network_msg_type == NL_I_AM_ROUTER]
 
     if routers:
         for r in routers:
-            nets = r.get('networks', [])
+            nets = r.networks
             log(f"  PASS: Router announces networks: {nets}")
         return True, routers
     else:
@@ -343,165 +576,146 @@ def test_who_is_router(sock, gateway):
         return False, responses
 
 
-def test_read_property_mstp(sock, gateway, device, mac):
+async def test_read_property_mstp(client, gateway, device, mac):
     """Test 3: ReadProperty to MS/TP device"""
     log(f"TEST 3: ReadProperty to Device {device} (MAC {mac}) on MS/TP")
 
     apdu = build_read_property(1, device, PROP_OBJECT_NAME)
-    npdu = build_npdu(apdu, dnet=MSTP_NETWORK, dadr=bytes([mac]), expecting_reply=True)
-    packet = build_bvlc(npdu)
+    npdu = build_routed_npdu(MSTP_NETWORK, mac)
 
     start = time.time()
-    sock.sendto(packet, gateway)
-
-    def is_response(r):
-        return r.get('type') in ['complex_ack', 'error', 'reject'] and r.get('invoke_id') == 1
+    client.send_bvlc(gateway, npdu, apdu)
 
-    responses = receive_until(sock, 5, is_response)
+    reply = await client.wait_for_reply(1, 5)
     elapsed = (time.time() - start) * 1000
 
-    ack = next((r for r in responses if r.get('type') == 'complex_ack'), None)
-    if ack:
+    if reply and reply.type == 'complex_ack':
         log(f"  PASS: Got Complex-ACK in {elapsed:.1f}ms")
-        return True, ack
+        return True, reply
     else:
-        error = next((r for r in responses if r.get('type') in ['error', 'reject']), None)
-        if error:
-            log(f"  FAIL: Got {error['type']} response")
+        if reply:
+            log(f"  FAIL: Got {reply.type} response")
         else:
             log(f"  FAIL: No response (timeout)")
-        return False, responses
+        return False, reply
 
 
-def test_read_property_gateway(sock, gateway):
+async def test_read_property_gateway(client, gateway):
     """Test 4: ReadProperty to gateway's local device"""
     log(f"TEST 4: ReadProperty to Gateway Device {GATEWAY_DEVICE}")
 
     # Direct to IP (no DNET)
     apdu = build_read_property(2, GATEWAY_DEVICE, PROP_OBJECT_NAME)
-    npdu = build_npdu(apdu, expecting_reply=True)
-    packet = build_bvlc(npdu)
+    npdu = build_npdu(expecting_reply=True)
 
-    sock.sendto(packet, gateway)
+    client.send_bvlc(gateway, npdu, apdu)
 
-    def is_response(r):
-        return r.get('type') in ['complex_ack', 'error', 'reject'] and r.get('invoke_id') == 2
+    reply = await client.wait_for_reply(2, 3)
 
-    responses = receive_until(sock, 3, is_response)
-
-    ack = next((r for r in responses if r.get('type') == 'complex_ack'), None)
-    if ack:
+    if reply and reply.type == 'complex_ack':
         log("  PASS: Gateway responded to ReadProperty")
-        return True, ack
+        return True, reply
     else:
         log("  FAIL: No response from gateway")
-        return False, responses
+        return False, reply
 
 
-def test_read_property_via_routing(sock, gateway):
+async def test_read_property_via_routing(client, gateway):
     """Test 5: ReadProperty to gateway via MS/TP routing (routed request)"""
     log(f"TEST 5: ReadProperty to Gateway via MS/TP routing (DNET={MSTP_NETWORK})")
 
     apdu = build_read_property(3, GATEWAY_DEVICE, PROP_OBJECT_NAME)
-    npdu = build_npdu(apdu, dnet=MSTP_NETWORK, dadr=bytes([GATEWAY_MAC]), expecting_reply=True)
-    packet = build_bvlc(npdu)
-
-    sock.sendto(packet, gateway)
+    npdu = build_routed_npdu(MSTP_NETWORK, GATEWAY_MAC)
 
-    def is_response(r):
-        return r.get('type') in ['complex_ack', 'error', 'reject'] and r.get('invoke_id') == 3
+    client.send_bvlc(gateway, npdu, apdu)
 
-    responses = receive_until(sock, 5, is_response)
+    reply = await client.wait_for_reply(3, 5)
 
-    ack = next((r for r in responses if r.get('type') == 'complex_ack'), None)
-    if ack:
+    if reply and reply.type == 'complex_ack':
         log("  PASS: Gateway responded via MS/TP routing")
-        return True, ack
+        return True, reply
     else:
         log("  FAIL: No routed response from gateway")
-        return False, responses
+        return False, reply
 
 
-def test_unknown_device(sock, gateway):
+async def test_unknown_device(client, gateway):
     """Test 6: ReadProperty to non-existent device (expect no response/timeout)"""
     log("TEST 6: ReadProperty to non-existent device 99999 on MS/TP")
 
     apdu = build_read_property(4, 99999, PROP_OBJECT_NAME)
-    npdu = build_npdu(apdu, dnet=MSTP_NETWORK, dadr=bytes([99]), expecting_reply=True)
-    packet = build_bvlc(npdu)
-
-    sock.sendto(packet, gateway)
+    npdu = build_routed_npdu(MSTP_NETWORK, 99)
 
-    def is_response(r):
-        return r.get('invoke_id') == 4
+    client.send_bvlc(gateway, npdu, apdu)
 
-    responses = receive_until(sock, 3, is_response)
+    reply = await client.wait_for_reply(4, 3)
 
-    if not responses:
+    if not reply:
         log("  PASS: No response (correct - device doesn't exist)")
         return True, []
     else:
-        log(f"  INFO: Got {len(responses)} unexpected response(s)")
-        return True, responses  # Still pass - might get network reject
+        log("  INFO: Got an unexpected response")
+        return True, [reply]  # Still pass - might get network reject
 
 
-def test_unknown_network(sock, gateway):
+async def test_unknown_network(client, gateway):
     """Test 7: Request to unknown network (expect Reject-Message-To-Network)"""
     log("TEST 7: Request to unknown network 59999")
 
     apdu = build_read_property(5, 1, PROP_OBJECT_NAME)
-    npdu = build_npdu(apdu, dnet=59999, dadr=bytes([1]), expecting_reply=True)
-    packet = build_bvlc(npdu)
+    npdu = build_npdu(dnet=59999, dadr=bytes([1]), expecting_reply=True)
 
-    sock.sendto(packet, gateway)
-    responses = receive_until(sock, 3)
+    client.send_bvlc(gateway, npdu, apdu)
+    responses = await client.receive_until(3)
 
-    reject = next((r for r in responses if r.get('type') == 'network_msg'
-                   and r.get('network_msg_type') == NL_REJECT_MESSAGE), None)
+    # The group runs concurrently, so only a reject naming our DNET is ours
+    reject = next((r for r in responses if r.type == 'network_msg'
+                   and r.network_msg_type == NL_REJECT_MESSAGE
+                   and r.rejected_net == 59999), None)
 
     if reject:
-        log("  PASS: Got Reject-Message-To-Network")
+        log(f"  PASS: Got Reject-Message-To-Network for 59999 (reason {reject.reason})")
         return True, reject
     else:
         log("  WARN: No reject message received (may be silently dropped)")
         return True, responses  # Still pass - behavior varies
 
 
-def test_foreign_device_register(sock, gateway):
+async def test_foreign_device_register(client, gateway):
     """Test 8: Register as Foreign Device"""
     log("TEST 8: Register-Foreign-Device (TTL=60s)")
 
     packet = build_register_fd(60)
-    sock.sendto(packet, gateway)
+    client.sendto(packet, gateway)
 
-    responses = receive_until(sock, 2)
+    responses = await client.receive_until(2)
 
-    result = next((r for r in responses if r.get('type') == 'bvlc_result'), None)
+    result = next((r for r in responses if r.type == 'bvlc_result'), None)
 
-    if result and result.get('result_code') == 0:
+    if result and result.result_code == 0:
         log("  PASS: Registration successful (result=0)")
         return True, result
     elif result:
-        log(f"  FAIL: Registration failed (result={result.get('result_code')})")
+        log(f"  FAIL: Registration failed (result={result.result_code})")
         return False, result
     else:
         log("  FAIL: No BVLC-Result received")
         return False, responses
 
 
-def test_read_fdt(sock, gateway):
+async def test_read_fdt(client, gateway):
     """Test 9: Read Foreign Device Table"""
     log("TEST 9: Read-Foreign-Device-Table")
 
     packet = build_read_fdt()
-    sock.sendto(packet, gateway)
+    client.sendto(packet, gateway)
 
-    responses = receive_until(sock, 2)
+    responses = await client.receive_until(2)
 
-    fdt = next((r for r in responses if r.get('type') == 'fdt_ack'), None)
+    fdt = next((r for r in responses if r.type == 'fdt_ack'), None)
 
     if fdt:
-        entries = fdt.get('fdt_entries', [])
+        entries = fdt.fdt_entries
         log(f"  PASS: FDT has {len(entries)} entries")
         for e in entries:
             log(f"    - {e['address']} TTL={e['ttl']}s remaining={e['remaining']}s")
@@ -511,30 +725,31 @@ def test_read_fdt(sock, gateway):
         return False, responses
 
 
-def test_performance(sock, gateway, device, mac, iterations=10):
+async def test_performance(client, gateway, device, mac, iterations=10):
     """Test 10: Performance - multiple rapid requests"""
     log(f"TEST 10: Performance test ({iterations} ReadProperty requests)")
 
     times = []
     successes = 0
 
+    # Send every request up front, then match replies back to them by invoke ID
+    npdu = build_routed_npdu(MSTP_NETWORK, mac)
+    outstanding = {}  # invoke ID -> send time
     for i in range(iterations):
         apdu = build_read_property(10 + i, device, PROP_OBJECT_NAME)
-        npdu = build_npdu(apdu, dnet=MSTP_NETWORK, dadr=bytes([mac]), expecting_reply=True)
-        packet = build_bvlc(npdu)
-
-        start = time.time()
-        sock.sendto(packet, gateway)
-
-        def is_resp(r):
-            return r.get('invoke_id') == 10 + i
-
-        responses = receive_until(sock, 3, is_resp)
-        elapsed = (time.time() - start) * 1000
-
-        if any(r.get('type') == 'complex_ack' for r in responses):
-            times.append(elapsed)
+        outstanding[10 + i] = time.time()
+        client.send_bvlc(gateway, npdu, apdu)
+
+    def on_response(r):
+        nonlocal successes
+        start = outstanding.pop(r.invoke_id, None)
+        if start is not None and r.type == 'complex_ack':
+            times.append((time.time() - start) * 1000)
             successes += 1
+        return not outstanding
+
+    # Same worst case as waiting 3s for each request in turn
+    await client.receive_until(3 * iterations, on_response)
 
     if times:
         avg = sum(times) / len(times)
@@ -552,101 +767,105 @@ def test_performance(sock, gateway, device, mac, iterations=10):
 # MAIN
 # =============================================================================
 
-def main():
-    parser = argparse.ArgumentParser(description='Comprehensive BACnet Gateway Test')
-    parser.add_argument('--gateway', '-g', default=DEFAULT_GATEWAY_IP)
-    parser.add_argument('--device', '-d', type=int, help='MS/TP device instance for tests')
-    parser.add_argument('--mac', '-m', type=int, help='MS/TP MAC address for tests')
-    parser.add_argument('--skip-perf', action='store_true', help='Skip performance test')
-    args = parser.parse_args()
-
-    gateway = (args.gateway, BACNET_PORT)
-
-    print("=" * 70)
-    print("COMPREHENSIVE BACNET GATEWAY TEST SUITE")
-    print("=" * 70)
-    print(f"Gateway: {args.gateway}:{BACNET_PORT}")
-    print(f"IP Network: {IP_NETWORK}, MS/TP Network: {MSTP_NETWORK}")
-    print("=" * 70)
 
+async def run_suite(args, gateway):
+    """Run the tests, overlapping the independent ones; returns results in test order"""
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     sock.bind(('0.0.0.0', 0))
+    enlarge_socket_buffers(sock, lambda msg: log(msg, "WARN"))
+
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(lambda: BacnetClient(sock), sock=sock)
 
-    results = {}
     mstp_device = args.device
     mstp_mac = args.mac
 
     try:
         # Test 1: Who-Is Global
-        print()
-        passed, data = test_who_is_global(sock, gateway)
-        results['who_is_global'] = passed
-
-        # Auto-discover an MS/TP device if not specified
-        if not mstp_device and data:
-            for d in data:
-                if d.get('npdu', {}).get('snet') == MSTP_NETWORK:
-                    mstp_device = d.get('device_instance')
-                    mstp_mac = d['npdu']['sadr'][0] if d['npdu'].get('sadr') else None
-                    log(f"Auto-discovered: Device {mstp_device} on MAC {mstp_mac}")
-                    break
-
-        # Test 2: Who-Is-Router
-        print()
-        passed, _ = test_who_is_router(sock, gateway)
-        results['who_is_router'] = passed
-
-        # Test 3: ReadProperty to MS/TP
-        if mstp_device and mstp_mac:
-            print()
-            passed, _ = test_read_property_mstp(sock, gateway, mstp_device, mstp_mac)
-            results['read_property_mstp'] = passed
-        else:
+        who_is = asyncio.ensure_future(run_test(test_who_is_global, client, gateway))
+
+        # Test 2: Who-Is-Router-To-Network
+        who_is_router = asyncio.ensure_future(run_test(test_who_is_router, client, gateway))
+
+        # Test 3: ReadProperty to MS/TP, once Test 1 has found a device if none was given
+        async def read_property_mstp():
+            nonlocal mstp_device, mstp_mac
+            if not mstp_device:
+                _, data = await who_is
+                # Auto-discover an MS/TP device (data is None if Test 1 raised)
+                for d in data or ():
+                    if d.snet == MSTP_NETWORK:
+                        mstp_device = d.device_instance
+                        mstp_mac = d.sadr[0] if d.sadr else None
+                        log(f"Auto-discovered: Device {mstp_device} on MAC {mstp_mac}")
+                        break
+            if mstp_device and mstp_mac:
+                return await run_test(test_read_property_mstp, client, gateway, mstp_device, mstp_mac)
             log("SKIP: Test 3 - No MS/TP device available")
-            results['read_property_mstp'] = None
-
-        # Test 4: ReadProperty to Gateway (direct)
-        print()
-        passed, _ = test_read_property_gateway(sock, gateway)
-        results['read_property_gateway'] = passed
+            return None, None
+
+        # Test 8: Register as Foreign Device, after the Who-Is tests: once registered, the
+        # BBMD also forwards broadcast I-Ams to us, so Test 1 would count devices twice
+        async def register_fd():
+            await asyncio.gather(who_is, who_is_router)
+            return await run_test(test_foreign_device_register, client, gateway)
+
+        register = asyncio.ensure_future(register_fd())
+
+        # Test 9: the FDT read expects our registration to be in it
+        async def read_fdt():
+            await register
+            return await run_test(test_read_fdt, client, gateway)
+
+        # Summary name -> (passed, data) awaitable, in test order. Anything not waiting on
+        # another test starts at once: replies are told apart by type and invoke ID
+        tests = {
+            'who_is_global': who_is,
+            'who_is_router': who_is_router,
+            'read_property_mstp': read_property_mstp(),
+            'read_property_gateway': run_test(test_read_property_gateway, client, gateway),
+            'read_property_gateway_routed': run_test(test_read_property_via_routing, client, gateway),
+            'unknown_device': run_test(test_unknown_device, client, gateway),
+            'unknown_network': run_test(test_unknown_network, client, gateway),
+            'register_fd': register,
+            'read_fdt': read_fdt(),
+        }
+        outcomes = await asyncio.gather(*tests.values())
+        results = {name: passed for name, (passed, _) in zip(tests, outcomes)}
+
+        # Test 10: Performance, on its own so other traffic doesn't skew the timings
+        if not args.skip_perf and mstp_device and mstp_mac:
+            passed, perf = await run_test(test_performance, client, gateway, mstp_device, mstp_mac)
+            results['performance'] = passed
+        else:
+            results['performance'] = None
 
-        # Test 5: ReadProperty to Gateway via routing
-        print()
-        passed, _ = test_read_property_via_routing(sock, gateway)
-        results['read_property_gateway_routed'] = passed
+    finally:
+        transport.close()
 
-        # Test 6: Unknown device
-        print()
-        passed, _ = test_unknown_device(sock, gateway)
-        results['unknown_device'] = passed
+    return results
 
-        # Test 7: Unknown network
-        print()
-        passed, _ = test_unknown_network(sock, gateway)
-        results['unknown_network'] = passed
 
-        # Test 8: Register Foreign Device
-        print()
-        passed, _ = test_foreign_device_register(sock, gateway)
-        results['register_fd'] = passed
+def main():
+    parser = argparse.ArgumentParser(description='Comprehensive BACnet Gateway Test')
+    parser.add_argument('--gateway', '-g', default=DEFAULT_GATEWAY_IP)
+    parser.add_argument('--device', '-d', type=int, help='MS/TP device instance for tests')
+    parser.add_argument('--mac', '-m', type=int, help='MS/TP MAC address for tests')
+    parser.add_argument('--skip-perf', action='store_true', help='Skip performance test')
+    args = parser.parse_args()
 
-        # Test 9: Read FDT
-        print()
-        passed, _ = test_read_fdt(sock, gateway)
-        results['read_fdt'] = passed
+    gateway = (args.gateway, BACNET_PORT)
 
-        # Test 10: Performance
-        if not args.skip_perf and mstp_device and mstp_mac:
-            print()
-            passed, perf = test_performance(sock, gateway, mstp_device, mstp_mac)
-            results['performance'] = passed
-        else:
-            results['performance'] = None
+    print("=" * 70)
+    print("COMPREHENSIVE BACNET GATEWAY TEST SUITE")
+    print("=" * 70)
+    print(f"Gateway: {args.gateway}:{BACNET_PORT}")
+    print(f"IP Network: {IP_NETWORK}, MS/TP Network: {MSTP_NETWORK}")
+    print("=" * 70)
 
-    finally:
-        sock.close()
+    results = asyncio.run(run_suite(args, gateway))
 
     # Summary
     print()
@@ -15,12 +15,15 @@ Network Configuration:
 - MS/TP Network: 65001
 - Gateway device: 1234 on MS/TP MAC 3
 """
+import functools
 import socket
 import struct
 import time
 import argparse
-import threading
-from datetime import datetime
+import array
+
+from bacnet_udp import BatchReceiver, enlarge_socket_buffers
+from timestamps import timestamp
 
 # Default configuration
 DEFAULT_GATEWAY_IP = "192.168.86.141"
@@ -39,45 +42,37 @@ SERVICE_I_AM = 0
 SERVICE_READ_PROPERTY = 12
 
 
-def build_who_is(low_limit=None, high_limit=None):
-    """Build Who-Is APDU"""
-    apdu = bytes([0x10, SERVICE_WHO_IS])  # Unconfirmed request, Who-Is
+# Unconfirmed request, Who-Is, no limits: the usual discovery APDU
+_WHO_IS_NOLIMIT = bytes([0x10, SERVICE_WHO_IS])
 
-    if low_limit is not None and high_limit is not None:
-        # Context tag 0: low limit
-        if low_limit <= 255:
-            apdu += bytes([0x09, low_limit])
-        else:
-            apdu += bytes([0x0A, (low_limit >> 8) & 0xFF, low_limit & 0xFF])
 
-        # Context tag 1: high limit
-        if high_limit <= 255:
-            apdu += bytes([0x19, high_limit])
-        else:
-            apdu += bytes([0x1A, (high_limit >> 8) & 0xFF, high_limit & 0xFF])
+def build_who_is(low_limit=None, high_limit=None):
+    """Build Who-Is APDU"""
+    if low_limit is None or high_limit is None:
+        return _WHO_IS_NOLIMIT
 
-    return apdu
+    # Context tag 0: low limit, context tag 1: high limit; one or two bytes each
+    return struct.pack(
+        '>BB' + ('BB' if low_limit <= 255 else 'BH') + ('BB' if high_limit <= 255 else 'BH'),
+        0x10, SERVICE_WHO_IS,
+        0x09 if low_limit <= 255 else 0x0A, low_limit & 0xFFFF,
+        0x19 if high_limit <= 255 else 0x1A, high_limit & 0xFFFF)
 
 
 def build_read_property(invoke_id, device_instance, property_id):
     """Build ReadProperty APDU for Device object"""
     obj_id = (8 << 22) | device_instance  # Device object type = 8
-    obj_id_bytes = struct.pack('>I', obj_id)
 
-    apdu = bytes([
+    return struct.pack(
+        '>5BI' + ('BB' if property_id <= 255 else 'BH'),
         0x00,           # Confirmed request
         0x05,           # max-seg=0, max-apdu-len=5
         invoke_id,
         SERVICE_READ_PROPERTY,
         0x0C,           # Context tag 0, len=4 (object identifier)
-    ]) + obj_id_bytes
-
-    if property_id <= 255:
-        apdu += bytes([0x19, property_id])  # Context tag 1, len=1
-    else:
-        apdu += bytes([0x1A, (property_id >> 8) & 0xFF, property_id & 0xFF])
-
-    return apdu
+        obj_id,
+        # Context tag 1, len=1 or 2
+        0x19 if property_id <= 255 else 0x1A, property_id & 0xFFFF)
 
 
 def build_npdu(apdu, dnet=None, dadr=None, expecting_reply=False):
@@ -88,25 +83,33 @@ def build_npdu(apdu, dnet=None, dadr=None, expecting_reply=False):
     if expecting_reply:
         control |= 0x04  # Expecting reply
 
-    npdu = bytes([0x01, control])  # Version 1
+    if dnet is None:
+        return bytes([0x01, control]) + apdu  # Version 1
 
-    if dnet is not None:
-        npdu += struct.pack('>H', dnet)  # DNET
-        if dadr:
-            npdu += bytes([len(dadr)]) + dadr  # DLEN + DADR
-        else:
-            npdu += bytes([0])  # DLEN=0 (broadcast on that network)
-        npdu += bytes([0xFF])  # Hop count
-
-    npdu += apdu
-    return npdu
+    # Version 1, control, DNET, DLEN + DADR (DLEN=0: broadcast on that network), hop count
+    dadr = dadr or b''
+    return struct.pack(f'>BBHB{len(dadr)}sB', 0x01, control, dnet, len(dadr), dadr, 0xFF) + apdu
 
 
 def build_bvlc(npdu, is_broadcast=False):
     """Wrap NPDU in BVLC"""
     func = BVLC_ORIGINAL_BROADCAST if is_broadcast else BVLC_ORIGINAL_UNICAST
-    length = 4 + len(npdu)
-    return bytes([0x81, func, (length >> 8) & 0xFF, length & 0xFF]) + npdu
+    return struct.pack('>BBH', 0x81, func, 4 + len(npdu)) + npdu
+
+
+# The Who-Is packets only depend on constants, so they are built once at import. Like the
+# cached ReadProperty packets they go out with a single sendto(): the BVLC header is already
+# joined to the NPDU, so there is no per-send concatenation left for sendmsg() to avoid.
+_WHOIS_GLOBAL_PKT = build_bvlc(build_npdu(build_who_is(), dnet=0xFFFF), is_broadcast=True)  # Global broadcast
+_WHOIS_MSTP_PKT = build_bvlc(build_npdu(build_who_is(), dnet=MSTP_NETWORK), is_broadcast=True)  # MS/TP network broadcast
+
+
+@functools.lru_cache(maxsize=256)
+def build_read_property_packet(device_instance, mstp_mac, property_id, invoke_id=1):
+    """Complete BVLC packet for a ReadProperty routed to an MS/TP device"""
+    apdu = build_read_property(invoke_id, device_instance, property_id)
+    npdu = build_npdu(apdu, dnet=MSTP_NETWORK, dadr=bytes([mstp_mac]), expecting_reply=True)
+    return build_bvlc(npdu, is_broadcast=False)
 
 
 def parse_bvlc(data):
@@ -114,16 +117,14 @@ def parse_bvlc(data):
     if len(data) < 4 or data[0] != 0x81:
         return None, None, None
 
-    func = data[1]
-    length = (data[2] << 8) | data[3]
+    _, func, length = struct.unpack_from('>BBH', data, 0)
 
     if func == BVLC_FORWARDED_NPDU:
         # Skip original source address (6 bytes)
         if len(data) < 10:
             return None, None, None
-        orig_ip = f"{data[4]}.{data[5]}.{data[6]}.{data[7]}"
-        orig_port = (data[8] << 8) | data[9]
-        return func, f"{orig_ip}:{orig_port}", data[10:]
+        ip, orig_port = struct.unpack_from('>4sH', data, 4)
+        return func, f"{ip[0]}.{ip[1]}.{ip[2]}.{ip[3]}:{orig_port}", data[10:]
     else:
         return func, None, data[4:]
 
@@ -133,10 +134,23 @@ def parse_npdu(data):
     if len(data) < 2:
         return None
 
-    version = data[0]
-    control = data[1]
+    version, control = struct.unpack_from('>BB', data, 0)
     pos = 2
 
+    # Common case: no DNET, no SNET, not a network message - the APDU follows directly
+    if not control & 0xA8:
+        return {
+            'version': version,
+            'control': control,
+            'network_msg': False,
+            'dnet': None,
+            'dadr': None,
+            'snet': None,
+            'sadr': None,
+            'hop_count': None,
+            'apdu': data[2:] if len(data) > 2 else None
+        }
+
     result = {
         'version': version,
         'control': control,
@@ -153,8 +167,7 @@ def parse_npdu(data):
     if control & 0x20:
         if pos + 3 > len(data):
             return result
-        result['dnet'] = (data[pos] << 8) | data[pos+1]
-        dlen = data[pos+2]
+        result['dnet'], dlen = struct.unpack_from('>HB', data, pos)
         pos += 3
         if dlen > 0:
             if pos + dlen > len(data):
@@ -166,8 +179,7 @@ def parse_npdu(data):
     if control & 0x08:
         if pos + 3 > len(data):
             return result
-        result['snet'] = (data[pos] << 8) | data[pos+1]
-        slen = data[pos+2]
+        result['snet'], slen = struct.unpack_from('>HB', data, pos)
         pos += 3
         if slen > 0:
             if pos + slen > len(data):
@@ -188,6 +200,14 @@ def parse_npdu(data):
     return result
 
 
+# Application-tagged Unsigned with a 1- or 2-byte value (Max APDU Length, Vendor ID):
+# tag byte -> (value decoder, bytes taken including the tag)
+_UNSIGNED_TAGS = {
+    0x21: (struct.Struct('>B').unpack_from, 2),
+    0x22: (struct.Struct('>H').unpack_from, 3),
+}
+
+
 def parse_i_am(apdu):
     """Parse I-Am APDU"""
     if len(apdu) < 12:
@@ -196,25 +216,22 @@ def parse_i_am(apdu):
     if apdu[0] != 0x10 or apdu[1] != SERVICE_I_AM:
         return None
 
-    pos = 2
-
-    # Device Object Identifier (tag 0xC4)
-    if apdu[pos] != 0xC4:
+    # Device Object Identifier (tag 0xC4), then the Max APDU Length tag; the
+    # length check above covers everything up to the Max APDU Length value
+    tag, obj_id, max_apdu_tag = struct.unpack_from('>BIB', apdu, 2)
+    if tag != 0xC4:
         return None
-    pos += 1
 
-    obj_id = struct.unpack('>I', apdu[pos:pos+4])[0]
     device_instance = obj_id & 0x3FFFFF
-    pos += 4
+    pos = 7
 
     # Max APDU Length (tag 0x22 or 0x21)
     max_apdu = 0
-    if apdu[pos] == 0x22:
-        max_apdu = (apdu[pos+1] << 8) | apdu[pos+2]
-        pos += 3
-    elif apdu[pos] == 0x21:
-        max_apdu = apdu[pos+1]
-        pos += 2
+    decoder = _UNSIGNED_TAGS.get(max_apdu_tag)
+    if decoder:
+        unpack, size = decoder
+        max_apdu, = unpack(apdu, pos + 1)
+        pos += size
 
     # Segmentation Supported (tag 0x91)
     segmentation = 0
@@ -225,10 +242,9 @@ def parse_i_am(apdu):
     # Vendor ID (tag 0x21 or 0x22)
     vendor_id = 0
     if pos < len(apdu):
-        if apdu[pos] == 0x22:
-            vendor_id = (apdu[pos+1] << 8) | apdu[pos+2]
-        elif apdu[pos] == 0x21:
-            vendor_id = apdu[pos+1]
+        decoder = _UNSIGNED_TAGS.get(apdu[pos])
+        if decoder:
+            vendor_id, = decoder[0](apdu, pos + 1)
 
     return {
         'device_instance': device_instance,
@@ -244,9 +260,7 @@ def test_who_is_global(sock, gateway_addr):
     print("TEST 1: Who-Is Global Broadcast (DNET=0xFFFF)")
     print("="*60)
 
-    apdu = build_who_is()
-    npdu = build_npdu(apdu, dnet=0xFFFF)  # Global broadcast
-    packet = build_bvlc(npdu, is_broadcast=True)
+    packet = _WHOIS_GLOBAL_PKT
 
     print(f"Sending to {gateway_addr}")
     print(f"Packet ({len(packet)} bytes): {packet.hex()}")
@@ -261,9 +275,7 @@ def test_who_is_mstp_network(sock, gateway_addr):
     print(f"TEST 2: Who-Is to MS/TP Network {MSTP_NETWORK}")
     print("="*60)
 
-    apdu = build_who_is()
-    npdu = build_npdu(apdu, dnet=MSTP_NETWORK)  # MS/TP network broadcast
-    packet = build_bvlc(npdu, is_broadcast=True)
+    packet = _WHOIS_MSTP_PKT
 
     print(f"Sending to {gateway_addr}")
     print(f"Packet ({len(packet)} bytes): {packet.hex()}")
@@ -278,9 +290,7 @@ def test_read_property(sock, gateway_addr, device_instance, mstp_mac, property_i
     print(f"TEST 3: ReadProperty to Device {device_instance} (MAC {mstp_mac}) on MS/TP")
     print("="*60)
 
-    apdu = build_read_property(1, device_instance, property_id)
-    npdu = build_npdu(apdu, dnet=MSTP_NETWORK, dadr=bytes([mstp_mac]), expecting_reply=True)
-    packet = build_bvlc(npdu, is_broadcast=False)
+    packet = build_read_property_packet(device_instance, mstp_mac, property_id)
 
     print(f"Property ID: {property_id} ({'Object-Identifier' if property_id == 75 else 'Object-Name' if property_id == 77 else property_id})")
     print(f"Sending to {gateway_addr}")
@@ -290,110 +300,181 @@ def test_read_property(sock, gateway_addr, device_instance, mstp_mac, property_i
     return True
 
 
-def receive_responses(sock, timeout=10):
-    """Receive and parse responses"""
+class DeviceTable:
+    """Devices discovered by I-Am, as one array per field rather than a dict per device
+
+    network is 0 for a local (unrouted) device and mac is -1 when the I-Am carried no SADR.
+    """
+
+    def __init__(self):
+        self.instances = array.array('I')
+        self.networks = array.array('H')
+        self.macs = array.array('h')
+        self.vendors = array.array('H')
+
+    def add(self, instance, network, mac, vendor):
+        self.instances.append(instance)
+        self.networks.append(network or 0)
+        self.macs.append(-1 if mac is None else mac)
+        self.vendors.append(vendor)
+
+    def __len__(self):
+        return len(self.instances)
+
+    def __iter__(self):
+        return zip(self.instances, self.networks, self.macs, self.vendors)
+
+    def count_on(self, network):
+        """Number of devices discovered on network"""
+        return self.networks.count(network)
+
+
+# Printed labels, indexed by the raw byte/nibble so the receive loop does no formatting
+_HEX2 = tuple(f'{i:02X}' for i in range(256))
+
+_BVLC_FUNC_NAMES = {
+    0x04: "Forwarded-NPDU",
+    0x0A: "Original-Unicast",
+    0x0B: "Original-Broadcast"
+}
+_BVLC_FUNC_LABELS = tuple(_BVLC_FUNC_NAMES.get(i, f'0x{_HEX2[i]}') for i in range(256))
+
+_PDU_TYPE_NAMES = {
+    0: "Confirmed-REQ", 1: "Unconfirmed-REQ", 2: "Simple-ACK",
+    3: "Complex-ACK", 4: "Segment-ACK", 5: "Error", 6: "Reject", 7: "Abort"
+}
+_PDU_TYPE_LABELS = tuple(_PDU_TYPE_NAMES.get(i, f'Unknown({i})') for i in range(16))
+
+
+def _handle_unconfirmed(apdu, npdu, devices_found):
+    service = apdu[1]
+    if service == SERVICE_I_AM:
+        iam = parse_i_am(apdu)
+        if iam:
+            source_info = ""
+            if npdu['snet']:
+                mac = npdu['sadr'][0] if npdu['sadr'] else "?"
+                source_info = f" (Network {npdu['snet']}, MAC {mac})"
+            print(f"  >>> I-AM: Device {iam['device_instance']}{source_info}, Vendor {iam['vendor_id']}")
+            devices_found.add(
+                iam['device_instance'],
+                npdu['snet'],
+                npdu['sadr'][0] if npdu['sadr'] else None,
+                iam['vendor_id'])
+
+
+def _handle_complex_ack(apdu, npdu, devices_found):
+    invoke_id = apdu[1]
+    service = apdu[2]
+    print(f"  >>> Complex-ACK: Invoke={invoke_id}, Service={service}")
+    if service == SERVICE_READ_PROPERTY:
+        print("  >>> ReadProperty SUCCESS - routing works!")
+
+
+def _handle_error(apdu, npdu, devices_found):
+    invoke_id = apdu[1]
+    service = apdu[2]
+    print(f"  >>> Error: Invoke={invoke_id}, Service={service}")
+
+
+def _handle_reject(apdu, npdu, devices_found):
+    invoke_id = apdu[1]
+    reason = apdu[2] if len(apdu) > 2 else 0
+    print(f"  >>> Reject: Invoke={invoke_id}, Reason={reason}")
+
+
+# APDU type -> handler for the replies the tests care about
+_PDU_HANDLERS = {
+    1: _handle_unconfirmed,
+    3: _handle_complex_ack,
+    5: _handle_error,
+    6: _handle_reject,
+}
+
+
+def receive_responses(receiver, timeout=10, verbose=False, replies=()):
+    """Receive and parse responses, starting with any replies already read by wait_for_reply()"""
     print("\n" + "="*60)
     print(f"LISTENING FOR RESPONSES (timeout: {timeout}s)")
     print("="*60)
 
-    devices_found = []
-    start_time = time.time()
-
-    sock.settimeout(1.0)  # 1 second per recv call
-
-    while time.time() - start_time < timeout:
+    devices_found = DeviceTable()
+    start_time = time.monotonic()
+    packets = replies
+
+    while True:
+        for data, addr in packets:
+            try:
+                print(f"\n[{timestamp()}] Received {len(data)} bytes from {addr}")
+                if verbose:
+                    print(f"  Raw: {data.hex()}")
+
+                # Parse BVLC
+                func, orig_addr, npdu_data = parse_bvlc(data)
+                if func is None:
+                    print("  ERROR: Invalid BVLC header")
+                    continue
+
+                print(f"  BVLC: {_BVLC_FUNC_LABELS[func]}", end="")
+                if orig_addr:
+                    print(f" (original: {orig_addr})", end="")
+                print()
+
+                # Parse NPDU
+                npdu = parse_npdu(npdu_data)
+                if npdu is None:
+                    print("  ERROR: Invalid NPDU")
+                    continue
+
+                print(f"  NPDU: control=0x{_HEX2[npdu['control']]}", end="")
+                if npdu['snet']:
+                    sadr_str = npdu['sadr'].hex() if npdu['sadr'] else "broadcast"
+                    print(f", SNET={npdu['snet']}, SADR={sadr_str}", end="")
+                if npdu['dnet']:
+                    dadr_str = npdu['dadr'].hex() if npdu['dadr'] else "broadcast"
+                    print(f", DNET={npdu['dnet']}, DADR={dadr_str}", end="")
+                if npdu['hop_count'] is not None:
+                    print(f", hop={npdu['hop_count']}", end="")
+                print()
+
+                # Parse APDU
+                if npdu['apdu']:
+                    apdu = npdu['apdu']
+                    pdu_type = (apdu[0] >> 4) & 0x0F
+                    print(f"  APDU: {_PDU_TYPE_LABELS[pdu_type]}")
+
+                    handler = _PDU_HANDLERS.get(pdu_type)
+                    if handler:
+                        handler(apdu, npdu, devices_found)
+
+            except Exception as e:
+                print(f"Error receiving: {e}")
+
+        remaining = timeout - (time.monotonic() - start_time)
+        if remaining <= 0:
+            break
         try:
-            data, addr = sock.recvfrom(1500)
-            ts = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-
-            print(f"\n[{ts}] Received {len(data)} bytes from {addr}")
-            print(f"  Raw: {data.hex()}")
-
-            # Parse BVLC
-            func, orig_addr, npdu_data = parse_bvlc(data)
-            if func is None:
-                print("  ERROR: Invalid BVLC header")
-                continue
-
-            func_names = {
-                0x04: "Forwarded-NPDU",
-                0x0A: "Original-Unicast",
-                0x0B: "Original-Broadcast"
-            }
-            print(f"  BVLC: {func_names.get(func, f'0x{func:02X}')}", end="")
-            if orig_addr:
-                print(f" (original: {orig_addr})", end="")
-            print()
-
-            # Parse NPDU
-            npdu = parse_npdu(npdu_data)
-            if npdu is None:
-                print("  ERROR: Invalid NPDU")
-                continue
-
-            print(f"  NPDU: control=0x{npdu['control']:02X}", end="")
-            if npdu['snet']:
-                sadr_str = npdu['sadr'].hex() if npdu['sadr'] else "broadcast"
-                print(f", SNET={npdu['snet']}, SADR={sadr_str}", end="")
-            if npdu['dnet']:
-                dadr_str = npdu['dadr'].hex() if npdu['dadr'] else "broadcast"
-                print(f", DNET={npdu['dnet']}, DADR={dadr_str}", end="")
-            if npdu['hop_count'] is not None:
-                print(f", hop={npdu['hop_count']}", end="")
-            print()
-
-            # Parse APDU
-            if npdu['apdu']:
-                apdu = npdu['apdu']
-                pdu_type = (apdu[0] >> 4) & 0x0F
-                types = {
-                    0: "Confirmed-REQ", 1: "Unconfirmed-REQ", 2: "Simple-ACK",
-                    3: "Complex-ACK", 4: "Segment-ACK", 5: "Error", 6: "Reject", 7: "Abort"
-                }
-                print(f"  APDU: {types.get(pdu_type, f'Unknown({pdu_type})')}")
-
-                if pdu_type == 1:  # Unconfirmed
-                    service = apdu[1]
-                    if service == SERVICE_I_AM:
-                        iam = parse_i_am(apdu)
-                        if iam:
-                            source_info = ""
-                            if npdu['snet']:
-                                mac = npdu['sadr'][0] if npdu['sadr'] else "?"
-                                source_info = f" (Network {npdu['snet']}, MAC {mac})"
-                            print(f"  >>> I-AM: Device {iam['device_instance']}{source_info}, Vendor {iam['vendor_id']}")
-                            devices_found.append({
-                                'instance': iam['device_instance'],
-                                'network': npdu['snet'],
-                                'mac': npdu['sadr'][0] if npdu['sadr'] else None,
-                                'vendor': iam['vendor_id']
-                            })
-
-                elif pdu_type == 3:  # Complex-ACK
-                    invoke_id = apdu[1]
-                    service = apdu[2]
-                    print(f"  >>> Complex-ACK: Invoke={invoke_id}, Service={service}")
-                    if service == SERVICE_READ_PROPERTY:
-                        print("  >>> ReadProperty SUCCESS - routing works!")
-
-                elif pdu_type == 5:  # Error
-                    invoke_id = apdu[1]
-                    service = apdu[2]
-                    print(f"  >>> Error: Invoke={invoke_id}, Service={service}")
-
-                elif pdu_type == 6:  # Reject
-                    invoke_id = apdu[1]
-                    reason = apdu[2] if len(apdu) > 2 else 0
-                    print(f"  >>> Reject: Invoke={invoke_id}, Reason={reason}")
-
-        except socket.timeout:
-            continue
-        except Exception as e:
+            packets = receiver.receive(remaining)
+        except OSError as e:
             print(f"Error receiving: {e}")
+            packets = ()
 
     return devices_found
 
 
+def wait_for_reply(receiver, timeout, replies):
+    """Pace the next request: return as soon as a new reply arrives, or after timeout
+
+    Replies still queued from earlier requests are read first and don't end the wait.
+    Everything read is copied onto replies for receive_responses().
+    """
+    packets = receiver.receive(0)
+    while packets:
+        replies.extend((bytes(data), addr) for data, addr in packets)
+        packets = receiver.receive(0)
+    replies.extend((bytes(data), addr) for data, addr in receiver.receive(timeout))
+
+
 def main():
     parser = argparse.ArgumentParser(description='Test BACnet Gateway Routing')
     parser.add_argument('--gateway', '-g', default=DEFAULT_GATEWAY_IP,
@@ -406,6 +487,8 @@ def main():
                         help='Response timeout in seconds (default: 10)')
     parser.add_argument('--test', choices=['all', 'whois', 'readprop'], default='all',
                         help='Which test to run (default: all)')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='Hex dump every received packet')
     args = parser.parse_args()
 
     gateway_addr = (args.gateway, BACNET_PORT)
@@ -423,27 +506,31 @@ def main():
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     sock.bind(('0.0.0.0', 0))
+    enlarge_socket_buffers(sock)
 
     local_port = sock.getsockname()[1]
     print(f"Local port: {local_port}")
 
+    receiver = BatchReceiver(sock)
+    replies = []
+
     try:
         if args.test in ['all', 'whois']:
             # Test 1: Global Who-Is
             test_who_is_global(sock, gateway_addr)
-            time.sleep(0.1)
+            wait_for_reply(receiver, 0.1, replies)
 
             # Test 2: Who-Is to MS/TP network
             test_who_is_mstp_network(sock, gateway_addr)
 
         if args.test in ['all', 'readprop']:
             if args.device and args.mac:
-                time.sleep(0.2)
+                wait_for_reply(receiver, 0.2, replies)
                 # Test 3: ReadProperty
                 test_read_property(sock, gateway_addr, args.device, args.mac, 77)  # Object-Name
 
         # Listen for responses
-        devices = receive_responses(sock, args.timeout)
+        devices = receive_responses(receiver, args.timeout, args.verbose, replies)
 
         print("\n" + "="*60)
         print("SUMMARY")
@@ -451,14 +538,14 @@ def main():
 
         if devices:
             print(f"Discovered {len(devices)} device(s) via routing:")
-            for dev in devices:
-                net_info = f"Network {dev['network']}, MAC {dev['mac']}" if dev['network'] else "Local"
-                print(f"  - Device {dev['instance']} ({net_info}), Vendor {dev['vendor']}")
+            for instance, network, mac, vendor in devices:
+                net_info = f"Network {network}, MAC {mac if mac >= 0 else '?'}" if network else "Local"
+                print(f"  - Device {instance} ({net_info}), Vendor {vendor}")
 
             # Check if we got MS/TP devices
-            mstp_devices = [d for d in devices if d['network'] == MSTP_NETWORK]
-            if mstp_devices:
-                print(f"\n SUCCESS: {len(mstp_devices)} device(s) discovered on MS/TP network {MSTP_NETWORK}")
+            mstp_count = devices.count_on(MSTP_NETWORK)
+            if mstp_count:
+                print(f"\n SUCCESS: {mstp_count} device(s) discovered on MS/TP network {MSTP_NETWORK}")
                 print("  This confirms IP -> MS/TP -> IP routing is working!")
             else:
                 print(f"\n WARNING: No devices found on MS/TP network {MSTP_NETWORK}")
@@ -472,6 +559,7 @@ def main():
             print("  - Responses not being routed back to IP")
 
     finally:
+        receiver.close()
         sock.close()
 
 
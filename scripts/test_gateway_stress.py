@@ -13,19 +13,57 @@ Tests:
 8. Network layer message handling
 """
 
+import functools
+import os
 import socket
 import struct
 import time
 import sys
 import argparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from collections import defaultdict
+from collections import Counter
+from dataclasses import dataclass
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bacnet_udp import BatchReceiver, enlarge_socket_buffers, send_batch
 
 # BACnet constants
 BACNET_PORT = 47808
 BVLC_ORIGINAL_BROADCAST = 0x0b
 BVLC_ORIGINAL_UNICAST = 0x0a
 
+# BVLC header: type, function, length
+_BVLC = struct.Struct('>BBH')
+# Routed NPDU header: version, control, DNET, DLEN, DADR (one-byte MS/TP MAC), hop count
+_NPDU_ROUTED = struct.Struct('>BBHBBB')
+# DNET/SNET and the address length that follows it
+_NET_ADDR = struct.Struct('>HB')
+_U32 = struct.Struct('>I')
+# ReadProperty APDU: header, object ID, property ID (context tag 1) then an optional
+# array index (context tag 2), indexed [property ID is two bytes][no/one/two-byte index]
+_RP_APDU = tuple(
+    tuple(struct.Struct('>5BI' + prop_fmt + index_fmt) for index_fmt in ('', 'BB', 'BH'))
+    for prop_fmt in ('BB', 'BH'))
+# Context tag bytes for one- and two-byte property IDs and array indexes
+_PROP_ID_TAG = (0x19, 0x1a)
+_ARRAY_INDEX_TAG = (0x29, 0x2a)
+# Whole ReadProperty packets (one-byte property ID, no array index): BVLC header, NPDU
+# (routed: with DNET/DLEN/DADR/hop count), then the APDU
+_RP_ROUTED = struct.Struct('>BBH' + 'BBHBBB' + '5BIBB')
+_RP_LOCAL = struct.Struct('>BBH' + 'BB' + '5BIBB')
+# Offset of the invoke ID in those packets: BVLC (4) + NPDU + 2 bytes into the APDU
+_RP_ROUTED_INVOKE_OFFSET = 4 + 7 + 2
+_RP_LOCAL_INVOKE_OFFSET = 4 + 2 + 2
+# Invoke ID -> its one-byte bytes object, for splicing into packet templates
+_INVOKE_ID_BYTE = tuple(bytes((i,)) for i in range(256))
+# NPDU version and control byte
+_NPDU_HDR = struct.Struct('>BB')
+# NPDU control byte -> (DNET/DADR/hop count present, SNET/SADR present)
+_NPDU_CTRL = tuple((bool(c & 0x20), bool(c & 0x08)) for c in range(256))
+
 # Common BACnet property IDs
 PROPERTIES = {
     'object-identifier': 75,
@@ -62,6 +100,26 @@ PROPERTIES = {
     'event-state': 36,
 }
 
+@functools.lru_cache(maxsize=64)
+def _bvlc_header(func, length):
+    """BVLC header for a packet of the given function and total length; a run reuses a few"""
+    return _BVLC.pack(0x81, func, length)
+
+@functools.lru_cache(maxsize=1024)
+def _error_label(kind, *detail):
+    """'Error(2,32)'-style label, formatted once per distinct error rather than per reply"""
+    return f"{kind}({','.join(map(str, detail))})"
+
+# Result labels shared by every property read
+OK = 'OK'
+TIMEOUT = 'TIMEOUT'
+
+# socket.sendmsg is POSIX-only; elsewhere buffer lists are joined before sendto
+_HAVE_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+# Property IDs in PROPERTIES order, for the tests that cycle through them by index
+_PROPERTY_IDS = tuple(PROPERTIES.values())
+
 # Object types
 OBJECT_TYPES = {
     0: 'analog-input',
@@ -77,6 +135,13 @@ OBJECT_TYPES = {
     19: 'multi-state-value',
 }
 
+@dataclass(slots=True, frozen=True)
+class Device:
+    """A discovered device; network and mac are None for devices on the IP network"""
+    network: int | None
+    mac: int | None
+
+
 class BACnetTester:
     def __init__(self, gateway_ip, gateway_port=47808, mstp_network=65001, ip_network=10001):
         self.gateway_ip = gateway_ip
@@ -84,18 +149,28 @@ class BACnetTester:
         self.mstp_network = mstp_network
         self.ip_network = ip_network
         self.sock = None
+        # send_receive() reads every reply into this one buffer
+        self._rx = bytearray(1500)
+        self._rx_view = memoryview(self._rx)
         self.invoke_id = 0
         self.stats = {
             'requests_sent': 0,
             'responses_received': 0,
             'errors': 0,
             'timeouts': 0,
+            # Round trips of requests sent one at a time (send_receive)
+            'timed_responses': 0,
             'total_time': 0,
             'min_time': float('inf'),
             'max_time': 0,
+            # Batch send to each reply, with the whole batch in flight (send_batch_receive)
+            'pipelined_responses': 0,
+            'pipelined_total_time': 0,
+            'pipelined_min_time': float('inf'),
+            'pipelined_max_time': 0,
         }
-        self.errors_by_type = defaultdict(int)
-        self.devices = {}  # device_id -> {mac, objects, properties}
+        self.errors_by_type = Counter()
+        self.devices = {}  # device_id -> Device
 
     def create_socket(self):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -103,6 +178,7 @@ class BACnetTester:
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.sock.settimeout(3.0)
         self.sock.bind(('', 0))  # Random port
+        enlarge_socket_buffers(self.sock)
 
     def close(self):
         if self.sock:
@@ -138,167 +214,289 @@ class BACnetTester:
         # Object identifier (context tag 0)
         obj_id = (obj_type << 22) | (obj_instance & 0x3FFFFF)
 
-        apdu = bytearray([
+        # Property identifier (context tag 1), then the array index (context tag 2) if
+        # specified, each one or two bytes - the lengths pick the Struct and tag bytes
+        wide_prop = prop_id > 0xff
+        header = (
             0x00,  # Confirmed request, no segmentation
             0x05,  # Max segments=0, max APDU=480
             invoke_id,
             0x0c,  # ReadProperty service
             0x0c,  # Context tag 0, length 4
-            (obj_id >> 24) & 0xff,
-            (obj_id >> 16) & 0xff,
-            (obj_id >> 8) & 0xff,
-            obj_id & 0xff,
-        ])
-
-        # Property identifier (context tag 1)
-        if prop_id < 256:
-            apdu.extend([0x19, prop_id])
-        else:
-            apdu.extend([0x1a, (prop_id >> 8) & 0xff, prop_id & 0xff])
+            obj_id,
+            _PROP_ID_TAG[wide_prop], prop_id & 0xffff,
+        )
+        if array_index is None:
+            return _RP_APDU[wide_prop][0].pack(*header), invoke_id
+
+        wide_index = array_index > 0xff
+        apdu = _RP_APDU[wide_prop][1 + wide_index].pack(
+            *header, _ARRAY_INDEX_TAG[wide_index], array_index & 0xffff)
+        return apdu, invoke_id
+
+    def build_read_property_routed(self, obj_type, obj_instance, prop_id, dest_network, dest_mac):
+        """Complete BVLC packet for a ReadProperty to an MS/TP device, packed in one call
+
+        Same bytes as build_read_property -> build_npdu_routed -> build_bvlc.
+        """
+        if prop_id >= 256:
+            apdu, invoke_id = self.build_read_property(obj_type, obj_instance, prop_id)
+            return self.build_bvlc(self.build_npdu_routed(apdu, dest_network, dest_mac)), invoke_id
 
-        # Array index (context tag 2) if specified
-        if array_index is not None:
-            if array_index < 256:
-                apdu.extend([0x29, array_index])
-            else:
-                apdu.extend([0x2a, (array_index >> 8) & 0xff, array_index & 0xff])
+        invoke_id = self.next_invoke_id()
+        obj_id = (obj_type << 22) | (obj_instance & 0x3FFFFF)
+        packet = _RP_ROUTED.pack(
+            0x81, BVLC_ORIGINAL_UNICAST, _RP_ROUTED.size,
+            0x01, 0x24, dest_network & 0xffff, 0x01, dest_mac, 0xff,
+            0x00, 0x05, invoke_id, 0x0c, 0x0c, obj_id, 0x19, prop_id)
+        return packet, invoke_id
+
+    def build_read_property_local(self, obj_type, obj_instance, prop_id):
+        """Complete BVLC packet for a ReadProperty to a device on the IP network, packed in one call
 
-        return bytes(apdu), invoke_id
+        Same bytes as build_read_property -> build_npdu_local(expecting_reply=True) -> build_bvlc.
+        """
+        if prop_id >= 256:
+            apdu, invoke_id = self.build_read_property(obj_type, obj_instance, prop_id)
+            return self.build_bvlc(self.build_npdu_local(apdu, expecting_reply=True)), invoke_id
+
+        invoke_id = self.next_invoke_id()
+        obj_id = (obj_type << 22) | (obj_instance & 0x3FFFFF)
+        packet = _RP_LOCAL.pack(
+            0x81, BVLC_ORIGINAL_UNICAST, _RP_LOCAL.size,
+            0x01, 0x04,
+            0x00, 0x05, invoke_id, 0x0c, 0x0c, obj_id, 0x19, prop_id)
+        return packet, invoke_id
+
+    def read_property_templates(self, obj_instance, prop_ids, dest_network=None, dest_mac=None):
+        """Device-object ReadProperty packets per property, split around the invoke ID
+
+        Returns {prop_id: (head, tail)}; head + _INVOKE_ID_BYTE[invoke_id] + tail is the
+        request. Routed to dest_network/dest_mac when given, else local.
+        """
+        templates = {}
+        for prop_id in prop_ids:
+            if dest_network is None:
+                packet, _ = self.build_read_property_local(8, obj_instance, prop_id)
+                offset = _RP_LOCAL_INVOKE_OFFSET
+            else:
+                packet, _ = self.build_read_property_routed(8, obj_instance, prop_id, dest_network, dest_mac)
+                offset = _RP_ROUTED_INVOKE_OFFSET
+            templates[prop_id] = (packet[:offset], packet[offset + 1:])
+        return templates
 
     def build_npdu_routed(self, apdu, dest_network, dest_mac):
         """Build NPDU with routing to MS/TP device"""
-        npdu = bytearray([
+        return _NPDU_ROUTED.pack(
             0x01,  # Version
             0x24,  # Control: dest present, expecting reply
-            (dest_network >> 8) & 0xff,
-            dest_network & 0xff,
+            dest_network & 0xffff,
             0x01,  # DLEN = 1 (MS/TP MAC)
             dest_mac,
             0xff,  # Hop count
-        ])
-        npdu.extend(apdu)
-        return bytes(npdu)
+        ) + apdu
 
     def build_npdu_broadcast(self, apdu):
         """Build NPDU for global broadcast"""
-        npdu = bytearray([
+        return bytes([
             0x01,  # Version
             0x20,  # Control: dest present (broadcast)
             0xff, 0xff,  # DNET = 0xFFFF (global broadcast)
             0x00,  # DLEN = 0 (broadcast)
             0xff,  # Hop count
-        ])
-        npdu.extend(apdu)
-        return bytes(npdu)
+        ]) + apdu
 
     def build_npdu_local(self, apdu, expecting_reply=False):
         """Build simple NPDU for local device"""
         control = 0x04 if expecting_reply else 0x00
-        npdu = bytearray([0x01, control])
-        npdu.extend(apdu)
-        return bytes(npdu)
+        return bytes([0x01, control]) + apdu
 
     def build_bvlc(self, npdu, broadcast=False):
         """Wrap NPDU in BVLC"""
+        return b''.join(self.bvlc_parts(npdu, broadcast))
+
+    def bvlc_parts(self, npdu, broadcast=False):
+        """BVLC header and NPDU as separate buffers, for send_receive to send without joining"""
         func = BVLC_ORIGINAL_BROADCAST if broadcast else BVLC_ORIGINAL_UNICAST
-        length = len(npdu) + 4
-        return bytes([0x81, func, (length >> 8) & 0xff, length & 0xff]) + npdu
+        return [_bvlc_header(func, len(npdu) + 4), npdu]
 
     def send_receive(self, packet, timeout=3.0):
-        """Send packet and wait for response"""
+        """Send packet and wait for response
+
+        packet may also be a list of buffers (see bvlc_parts), sent as one datagram.
+        The response is a memoryview into a buffer that the next call overwrites.
+        """
         self.stats['requests_sent'] += 1
-        start = time.time()
+        start = time.perf_counter()
 
         try:
             self.sock.settimeout(timeout)
-            self.sock.sendto(packet, (self.gateway_ip, self.gateway_port))
-            data, addr = self.sock.recvfrom(1500)
-            elapsed = time.time() - start
+            if not isinstance(packet, list):
+                self.sock.sendto(packet, (self.gateway_ip, self.gateway_port))
+            elif _HAVE_SENDMSG:
+                # The kernel gathers the buffers into the datagram; no copy to join them here
+                self.sock.sendmsg(packet, [], 0, (self.gateway_ip, self.gateway_port))
+            else:
+                self.sock.sendto(b''.join(packet), (self.gateway_ip, self.gateway_port))
+            nbytes, addr = self.sock.recvfrom_into(self._rx)
+            elapsed = time.perf_counter() - start
 
             self.stats['responses_received'] += 1
+            self.stats['timed_responses'] += 1
             self.stats['total_time'] += elapsed
             self.stats['min_time'] = min(self.stats['min_time'], elapsed)
             self.stats['max_time'] = max(self.stats['max_time'], elapsed)
 
-            return data, elapsed
+            return self._rx_view[:nbytes], elapsed
         except socket.timeout:
             self.stats['timeouts'] += 1
-            return None, time.time() - start
+            return None, time.perf_counter() - start
         except Exception as e:
             self.stats['errors'] += 1
-            return None, time.time() - start
+            return None, time.perf_counter() - start
 
     def send_broadcast_collect(self, packet, timeout=5.0):
         """Send broadcast and collect all responses"""
         responses = []
         self.stats['requests_sent'] += 1
-        start = time.time()
+        start = time.perf_counter()
 
         try:
-            self.sock.settimeout(0.5)  # Short timeout for each recv
             self.sock.sendto(packet, (self.gateway_ip, self.gateway_port))
 
-            while time.time() - start < timeout:
-                try:
-                    data, addr = self.sock.recvfrom(1500)
-                    responses.append((data, addr, time.time() - start))
-                    self.stats['responses_received'] += 1
-                except socket.timeout:
-                    continue
+            # Sleep until replies are queued and take them all at once, rather than
+            # waking every 0.5s to take one
+            receiver = BatchReceiver(self.sock)
+            try:
+                deadline = start + timeout
+                while True:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    batch = receiver.receive(remaining)
+                    elapsed = time.perf_counter() - start
+                    for data, addr in batch:
+                        # data is a view into the receiver's buffer, reused on the next call
+                        responses.append((bytes(data), addr, elapsed))
+                    self.stats['responses_received'] += len(batch)
+            finally:
+                receiver.close()
 
         except Exception as e:
             self.stats['errors'] += 1
 
         return responses
 
+    def send_batch_receive(self, requests, timeout=3.0):
+        """Send requests back-to-back and collect the replies, matched by invoke ID
+
+        requests is [(invoke_id, packet), ...]. Returns {invoke_id: (data, elapsed)} for the
+        requests that were answered; the rest count as timeouts. The whole batch goes out
+        in one send, so elapsed runs from then to that reply and includes any time spent
+        queued behind the earlier requests - not the round trip of a request on its own.
+
+        Gives up once timeout passes without a reply to any of them, and never waits longer
+        than timeout per request, the worst case of sending them one at a time with
+        send_receive().
+        """
+        self.stats['requests_sent'] += len(requests)
+        pending = {invoke_id for invoke_id, _ in requests}
+        replies = {}
+        start = time.perf_counter()
+
+        try:
+            send_batch(self.sock, [packet for _, packet in requests], (self.gateway_ip, self.gateway_port))
+            receiver = BatchReceiver(self.sock)
+            try:
+                # Everything is in flight at once, so a dead device costs one timeout after
+                # the last reply rather than one per request; replies still queued behind a
+                # slow MS/TP bus keep pushing the deadline out
+                limit = start + timeout * len(requests)
+                deadline = min(start + timeout, limit)
+                while pending:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    batch = receiver.receive(remaining)
+                    # Everything in a batch arrived by the same wakeup, so it shares one time
+                    elapsed = time.perf_counter() - start
+                    for data, addr in batch:
+                        invoke_id = self.reply_invoke_id(data)
+                        if invoke_id not in pending:
+                            continue  # Late reply to an earlier test
+                        pending.discard(invoke_id)
+                        deadline = min(start + elapsed + timeout, limit)
+                        # data is a view into the receiver's buffer, reused on the next call
+                        replies[invoke_id] = (bytes(data), elapsed)
+
+                        self.stats['responses_received'] += 1
+                        self.stats['pipelined_responses'] += 1
+                        self.stats['pipelined_total_time'] += elapsed
+                        self.stats['pipelined_min_time'] = min(self.stats['pipelined_min_time'], elapsed)
+                        self.stats['pipelined_max_time'] = max(self.stats['pipelined_max_time'], elapsed)
+            finally:
+                receiver.close()
+        except OSError:
+            self.stats['errors'] += 1
+
+        self.stats['timeouts'] += len(pending)
+        return replies
+
+    def split_npdu(self, data):
+        """Walk the BVLC and NPDU headers of a packet
+
+        Returns (control, source network, source MAC, APDU offset); the source fields are
+        None when the NPDU has no SNET. Raises struct.error if the headers are truncated.
+        """
+        _, func, _ = _BVLC.unpack_from(data, 0)
+        # Forwarded-NPDU (0x04) has the 6-byte original address after the BVLC header
+        offset = 10 if func == 0x04 else 4
+        _, control = _NPDU_HDR.unpack_from(data, offset)
+        offset += 2
+        has_dest, has_src = _NPDU_CTRL[control]
+
+        source_network = None
+        source_mac = None
+
+        # NPDU order: DNET/DADR first, then SNET/SADR, then hop count
+        if has_dest:
+            _, dlen = _NET_ADDR.unpack_from(data, offset)
+            offset += 3 + dlen
+        if has_src:
+            source_network, slen = _NET_ADDR.unpack_from(data, offset)
+            offset += 3
+            if slen > 0 and offset < len(data):
+                source_mac = data[offset]
+            offset += slen
+        if has_dest:
+            offset += 1  # Hop count comes AFTER source
+
+        return control, source_network, source_mac, offset
+
+    def reply_invoke_id(self, data):
+        """Invoke ID of a confirmed-service reply (ACK, Error, Reject, Abort), else None"""
+        try:
+            if data[0] != 0x81:
+                return None
+            control, _, _, offset = self.split_npdu(data)
+            if control & 0x80:
+                return None  # Network layer message
+            if data[offset] >> 4 in (2, 3, 5, 6, 7):
+                return data[offset + 1]
+        except (IndexError, struct.error):
+            pass
+        return None
+
     def parse_i_am(self, data):
         """Parse I-Am response to extract device info"""
         try:
             # Skip BVLC header
             if data[0] != 0x81:
                 return None
-            bvlc_len = (data[2] << 8) | data[3]
-            npdu_start = 4
-
-            # Handle Forwarded-NPDU (0x04) - has 6-byte original address
-            if data[1] == 0x04:
-                npdu_start = 10  # Skip BVLC header (4) + original address (6)
-
-            # Parse NPDU
-            npdu_data = data[npdu_start:]
-            if len(npdu_data) < 2:
-                return None
-
-            control = npdu_data[1]
-            offset = 2
-
-            source_network = None
-            source_mac = None
-
-            # NPDU order: DNET/DADR first, then SNET/SADR, then hop count
-            # Check for destination specifier FIRST (bit 5)
-            if control & 0x20:
-                dnet = (npdu_data[offset] << 8) | npdu_data[offset + 1]
-                dlen = npdu_data[offset + 2]
-                offset += 3
-                if dlen > 0:
-                    offset += dlen  # Skip DADR
-
-            # Check for source specifier SECOND (bit 3)
-            if control & 0x08:
-                source_network = (npdu_data[offset] << 8) | npdu_data[offset + 1]
-                slen = npdu_data[offset + 2]
-                offset += 3
-                if slen > 0:
-                    source_mac = npdu_data[offset]
-                    offset += slen
-
-            # Hop count comes AFTER source (if dest was present)
-            if control & 0x20:
-                offset += 1  # Skip hop count
+            _, source_network, source_mac, offset = self.split_npdu(data)
 
             # Now at APDU
-            apdu = npdu_data[offset:]
+            apdu = data[offset:]
             if len(apdu) < 2:
                 return None
 
@@ -310,7 +508,7 @@ class BACnetTester:
             if len(apdu) < 7:
                 return None
             # apdu[2] should be 0xC4 (context tag 0, length 4) for object-id
-            obj_id = (apdu[3] << 24) | (apdu[4] << 16) | (apdu[5] << 8) | apdu[6]
+            obj_id, = _U32.unpack_from(apdu, 3)
             obj_type = obj_id >> 22
             obj_instance = obj_id & 0x3FFFFF
 
@@ -324,6 +522,60 @@ class BACnetTester:
         except Exception as e:
             return None
 
+    def parse_i_am_bulk(self, packets):
+        """parse_i_am for many replies at once, as (device_id, network, mac) columns
+
+        One entry per packet; device_id is -1 where parse_i_am would return None, and
+        network/mac are -1 where it reports None. With NumPy the columns are worked out
+        for all packets in one pass of array operations.
+        """
+        if np is None:
+            device_ids, networks, macs = [], [], []
+            for data in packets:
+                info = self.parse_i_am(data) or {'device_id': -1, 'network': None, 'mac': None}
+                device_ids.append(info['device_id'])
+                networks.append(-1 if info['network'] is None else info['network'])
+                macs.append(-1 if info['mac'] is None else info['mac'])
+            return device_ids, networks, macs
+
+        count = len(packets)
+        lengths = np.fromiter(map(len, packets), dtype=np.int64, count=count)
+        width = max(int(lengths.max()) if count else 0, 4) + 1
+        # Zero-padded (N, width) matrix; the extra column keeps every gather below in range
+        buf = np.zeros((count, width), dtype=np.uint8)
+        for i, data in enumerate(packets):
+            buf[i, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+        buf = buf.astype(np.int64)
+        rows = np.arange(count)
+
+        def at(pos):
+            return buf[rows, np.minimum(pos, width - 1)]
+
+        # Same walk as split_npdu; ok drops packets whose headers run past the end
+        start = np.where(buf[:, 1] == 0x04, 10, 4)  # Forwarded-NPDU
+        ok = (lengths >= 4) & (buf[:, 0] == 0x81) & (lengths >= start + 2)
+        control = at(start + 1)
+        pos = start + 2
+
+        has_dest = (control & 0x20) != 0
+        ok &= ~has_dest | (pos + 3 <= lengths)
+        pos = pos + np.where(has_dest, 3 + at(pos + 2), 0)
+
+        has_src = (control & 0x08) != 0
+        ok &= ~has_src | (pos + 3 <= lengths)
+        network = np.where(has_src, (at(pos) << 8) | at(pos + 1), -1)
+        slen = np.where(has_src, at(pos + 2), 0)
+        pos = pos + 3 * has_src
+        mac = np.where(has_src & (slen > 0) & (pos < lengths), at(pos), -1)
+        pos = pos + slen + has_dest
+
+        # I-Am (unconfirmed, service 0) with a Device object identifier
+        obj_id = (at(pos + 3) << 24) | (at(pos + 4) << 16) | (at(pos + 5) << 8) | at(pos + 6)
+        ok &= (pos + 7 <= lengths) & (at(pos) == 0x10) & (at(pos + 1) == 0x00) & (obj_id >> 22 == 8)
+
+        return (np.where(ok, obj_id & 0x3FFFFF, -1).tolist(),
+                np.where(ok, network, -1).tolist(), np.where(ok, mac, -1).tolist())
+
     def parse_read_property_ack(self, data):
         """Parse ReadProperty response"""
         try:
@@ -331,36 +583,9 @@ class BACnetTester:
                 return None, "Invalid BVLC"
 
             # Find APDU start
-            npdu_start = 4
-            if data[1] == 0x04:  # Forwarded-NPDU
-                npdu_start = 10
-
-            npdu_data = data[npdu_start:]
-            control = npdu_data[1]
-            offset = 2
-
-            # NPDU order: DNET/DADR first, then SNET/SADR, then hop count
-            # Skip dest specifier FIRST (bit 5)
-            if control & 0x20:
-                dnet = (npdu_data[offset] << 8) | npdu_data[offset + 1]
-                dlen = npdu_data[offset + 2]
-                offset += 3
-                if dlen > 0:
-                    offset += dlen  # Skip DADR
-
-            # Skip source specifier SECOND (bit 3)
-            if control & 0x08:
-                snet = (npdu_data[offset] << 8) | npdu_data[offset + 1]
-                slen = npdu_data[offset + 2]
-                offset += 3
-                if slen > 0:
-                    offset += slen  # Skip SADR
-
-            # Skip hop count (if dest was present)
-            if control & 0x20:
-                offset += 1
-
-            apdu = npdu_data[offset:]
+            _, _, _, offset = self.split_npdu(data)
+
+            apdu = data[offset:]
             if len(apdu) < 1:
                 return None, "Empty APDU"
 
@@ -371,13 +596,15 @@ class BACnetTester:
             elif apdu_type == 5:  # Error
                 error_class = apdu[3] if len(apdu) > 3 else 0
                 error_code = apdu[5] if len(apdu) > 5 else 0
-                return None, f"Error({error_class},{error_code})"
+                return None, _error_label("Error", error_class, error_code)
             elif apdu_type == 6:  # Reject
-                return None, f"Reject({apdu[2] if len(apdu) > 2 else 0})"
+                return None, _error_label("Reject", apdu[2] if len(apdu) > 2 else 0)
             elif apdu_type == 7:  # Abort
-                return None, f"Abort({apdu[2] if len(apdu) > 2 else 0})"
+                return None, _error_label("Abort", apdu[2] if len(apdu) > 2 else 0)
             else:
                 return None, f"Unexpected APDU type {apdu_type}"
+        except (IndexError, struct.error):
+            return None, "Truncated packet"
         except Exception as e:
             return None, str(e)
 
@@ -396,50 +623,57 @@ class BACnetTester:
         print("Sending Who-Is broadcast...")
         responses = self.send_broadcast_collect(bvlc, timeout=5.0)
 
-        for data, addr, elapsed in responses:
-            device_info = self.parse_i_am(data)
-            if device_info:
-                dev_id = device_info['device_id']
-                self.devices[dev_id] = {
-                    'mac': device_info.get('mac'),
-                    'network': device_info.get('network'),
-                    'objects': [],
-                    'properties': {},
-                }
-                net_info = f"network {device_info['network']}, MAC {device_info['mac']}" if device_info['network'] else "local"
-                print(f"  Found device {dev_id} ({net_info}) in {elapsed*1000:.1f}ms")
+        rows = []  # one line per device, written out in one block
+        device_ids, networks, macs = self.parse_i_am_bulk([data for data, _, _ in responses])
+        for dev_id, network, mac, (_, _, elapsed) in zip(device_ids, networks, macs, responses):
+            if dev_id < 0:
+                continue
+            network = None if network < 0 else network
+            mac = None if mac < 0 else mac
+            self.devices[dev_id] = Device(network, mac)
+            net_info = f"network {network}, MAC {mac}" if network else "local"
+            rows.append(f"  Found device {dev_id} ({net_info}) in {elapsed*1000:.1f}ms\n")
+        sys.stdout.write("".join(rows))
 
         print(f"\nDiscovered {len(self.devices)} device(s)")
         return len(self.devices) > 0
 
     def test_read_all_properties(self, device_id, mac=None, network=None):
         """Read all common properties from a device"""
-        results = {'success': 0, 'errors': 0, 'details': {}}
-
+        requests = self.property_requests(device_id, mac, network)
+        # Pipelined: every property request is in flight at once, replies matched by invoke ID
+        replies = self.send_batch_receive(requests, timeout=3.0)
+        return self.property_results(requests, replies)
+
+    def property_requests(self, device_id, mac=None, network=None):
+        """[(invoke_id, packet), ...] reading each of PROPERTIES from a device, in that order"""
+        requests = []
         for prop_name, prop_id in PROPERTIES.items():
             if network and mac is not None:
-                apdu, invoke_id = self.build_read_property(8, device_id, prop_id)
-                npdu = self.build_npdu_routed(apdu, network, mac)
+                packet, invoke_id = self.build_read_property_routed(8, device_id, prop_id, network, mac)
             else:
-                apdu, invoke_id = self.build_read_property(8, device_id, prop_id)
-                npdu = self.build_npdu_local(apdu, expecting_reply=True)
-
-            bvlc = self.build_bvlc(npdu, broadcast=False)
-            response, elapsed = self.send_receive(bvlc, timeout=3.0)
+                packet, invoke_id = self.build_read_property_local(8, device_id, prop_id)
+            requests.append((invoke_id, packet))
+        return requests
 
+    def property_results(self, requests, replies):
+        """Tally the replies to a property_requests() batch"""
+        results = {'success': 0, 'errors': 0, 'details': {}}
+        for prop_name, (invoke_id, _) in zip(PROPERTIES, requests):
+            response, elapsed = replies.get(invoke_id, (None, None))
             if response:
                 ack, error = self.parse_read_property_ack(response)
                 if ack:
                     results['success'] += 1
-                    results['details'][prop_name] = ('OK', elapsed)
+                    results['details'][prop_name] = (OK, elapsed)
                 else:
                     results['errors'] += 1
                     results['details'][prop_name] = (error, elapsed)
                     self.errors_by_type[error] += 1
             else:
                 results['errors'] += 1
-                results['details'][prop_name] = ('TIMEOUT', elapsed)
-                self.errors_by_type['TIMEOUT'] += 1
+                results['details'][prop_name] = (TIMEOUT, None)
+                self.errors_by_type[TIMEOUT] += 1
 
         return results
 
@@ -452,22 +686,31 @@ class BACnetTester:
         total_success = 0
         total_errors = 0
 
-        for dev_id, dev_info in self.devices.items():
-            print(f"\nScanning device {dev_id}...")
-            results = self.test_read_all_properties(
-                dev_id,
-                mac=dev_info.get('mac'),
-                network=dev_info.get('network')
-            )
-
-            print(f"  Properties: {results['success']} OK, {results['errors']} errors")
-            total_success += results['success']
-            total_errors += results['errors']
-
-            # Show errors
-            for prop, (status, elapsed) in results['details'].items():
-                if status != 'OK':
-                    print(f"    {prop}: {status}")
+        # Devices are scanned together so a slow MS/TP device overlaps the others instead
+        # of holding them up. Replies are matched on the one-byte invoke ID alone, so no
+        # more than 255 requests go out per batch.
+        devices = list(self.devices.items())
+        per_batch = max(1, 255 // len(PROPERTIES))
+        for i in range(0, len(devices), per_batch):
+            scans = [
+                (dev_id, self.property_requests(dev_id, dev_info.mac, dev_info.network))
+                for dev_id, dev_info in devices[i:i + per_batch]
+            ]
+            replies = self.send_batch_receive(
+                [request for _, requests in scans for request in requests], timeout=3.0)
+
+            for dev_id, requests in scans:
+                print(f"\nScanning device {dev_id}...")
+                results = self.property_results(requests, replies)
+
+                print(f"  Properties: {results['success']} OK, {results['errors']} errors")
+                total_success += results['success']
+                total_errors += results['errors']
+
+                # Show errors
+                sys.stdout.write("".join(
+                    f"    {prop}: {status}\n"
+                    for prop, (status, elapsed) in results['details'].items() if status != OK))
 
         print(f"\nTotal: {total_success} successful, {total_errors} errors")
         return total_errors == 0 or total_success > total_errors
@@ -482,15 +725,14 @@ class BACnetTester:
             print(f"\nReading object-list from device {dev_id}...")
 
             # Read object-list array index 0 (count)
-            if dev_info.get('network') and dev_info.get('mac') is not None:
+            if dev_info.network and dev_info.mac is not None:
                 apdu, _ = self.build_read_property(8, dev_id, 76, array_index=0)
-                npdu = self.build_npdu_routed(apdu, dev_info['network'], dev_info['mac'])
+                npdu = self.build_npdu_routed(apdu, dev_info.network, dev_info.mac)
             else:
                 apdu, _ = self.build_read_property(8, dev_id, 76, array_index=0)
                 npdu = self.build_npdu_local(apdu, expecting_reply=True)
 
-            bvlc = self.build_bvlc(npdu)
-            response, elapsed = self.send_receive(bvlc)
+            response, elapsed = self.send_receive(self.bvlc_parts(npdu))
 
             if response:
                 ack, error = self.parse_read_property_ack(response)
@@ -514,7 +756,7 @@ class BACnetTester:
             return False
 
         # Pick first MS/TP device
-        mstp_devices = [(d, i) for d, i in self.devices.items() if i.get('network')]
+        mstp_devices = [(d, i) for d, i in self.devices.items() if i.network]
         if not mstp_devices:
             print("  No MS/TP devices found")
             return False
@@ -529,47 +771,31 @@ class BACnetTester:
         failures = 0
 
         for round_num in range(num_rounds):
-            # Create multiple sockets for true concurrency
-            sockets = []
-            for _ in range(num_concurrent):
-                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                s.settimeout(5.0)
-                s.bind(('', 0))
-                sockets.append(s)
-
-            # Build requests
+            # Build requests; each has its own invoke ID, so one socket can carry them all
             requests = []
-            for i, s in enumerate(sockets):
-                prop_id = list(PROPERTIES.values())[i % len(PROPERTIES)]
-                apdu, invoke_id = self.build_read_property(8, dev_id, prop_id)
-                npdu = self.build_npdu_routed(apdu, dev_info['network'], dev_info['mac'])
-                bvlc = self.build_bvlc(npdu)
-                requests.append((s, bvlc))
-
-            # Send all at once
-            start = time.time()
-            for s, pkt in requests:
-                s.sendto(pkt, (self.gateway_ip, self.gateway_port))
-
-            # Collect responses
-            for s, _ in requests:
-                try:
-                    data, _ = s.recvfrom(1500)
+            for i in range(num_concurrent):
+                prop_id = _PROPERTY_IDS[i % len(_PROPERTY_IDS)]
+                packet, invoke_id = self.build_read_property_routed(
+                    8, dev_id, prop_id, dev_info.network, dev_info.mac)
+                requests.append((invoke_id, packet))
+
+            # Send all at once, then collect responses
+            start = time.perf_counter()
+            replies = self.send_batch_receive(requests, timeout=5.0)
+            for invoke_id, _ in requests:
+                data, _ = replies.get(invoke_id, (None, None))
+                if data:
                     ack, error = self.parse_read_property_ack(data)
                     if ack:
                         success += 1
                     else:
                         failures += 1
-                except socket.timeout:
+                else:
                     failures += 1
 
-            elapsed = time.time() - start
+            elapsed = time.perf_counter() - start
             print(f"  Round {round_num + 1}: {elapsed*1000:.1f}ms")
 
-            # Cleanup
-            for s in sockets:
-                s.close()
-
             time.sleep(0.5)  # Brief pause between rounds
 
         total = num_concurrent * num_rounds
@@ -577,7 +803,7 @@ class BACnetTester:
         return success > failures
 
     def test_rapid_fire(self):
-        """Test 5: Rapid sequential requests"""
+        """Test 5: Rapid pipelined requests, all in flight at once"""
         print("\n" + "="*70)
         print("TEST 5: Rapid-Fire Performance Test")
         print("="*70)
@@ -596,14 +822,19 @@ class BACnetTester:
         failures = 0
         times = []
 
-        start_total = time.time()
+        # Only the invoke ID differs between requests for the same property
+        templates = self.read_property_templates(gateway_id, _PROPERTY_IDS)
+        requests = []
         for i in range(num_requests):
-            prop_id = list(PROPERTIES.values())[i % len(PROPERTIES)]
-            apdu, _ = self.build_read_property(8, gateway_id, prop_id)
-            npdu = self.build_npdu_local(apdu, expecting_reply=True)
-            bvlc = self.build_bvlc(npdu)
-
-            response, elapsed = self.send_receive(bvlc, timeout=2.0)
+            head, tail = templates[_PROPERTY_IDS[i % len(_PROPERTY_IDS)]]
+            invoke_id = self.next_invoke_id()
+            requests.append((invoke_id, head + _INVOKE_ID_BYTE[invoke_id] + tail))
+
+        # All requests go out in one batch; replies are matched back by invoke ID
+        start_total = time.perf_counter()
+        replies = self.send_batch_receive(requests, timeout=2.0)
+        for invoke_id, _ in requests:
+            response, elapsed = replies.get(invoke_id, (None, None))
             if response:
                 ack, error = self.parse_read_property_ack(response)
                 if ack:
@@ -614,7 +845,7 @@ class BACnetTester:
             else:
                 failures += 1
 
-        total_elapsed = time.time() - start_total
+        total_elapsed = time.perf_counter() - start_total
 
         if times:
             avg_time = sum(times) / len(times)
@@ -625,19 +856,19 @@ class BACnetTester:
             print(f"\nResults: {success}/{num_requests} successful")
             print(f"  Total time: {total_elapsed:.2f}s")
             print(f"  Requests/sec: {requests_per_sec:.1f}")
-            print(f"  Response times: avg={avg_time*1000:.1f}ms, min={min_time*1000:.1f}ms, max={max_time*1000:.1f}ms")
+            print(f"  Time to reply with all {num_requests} in flight: avg={avg_time*1000:.1f}ms, min={min_time*1000:.1f}ms, max={max_time*1000:.1f}ms")
         else:
             print(f"  All requests failed!")
 
         return success > num_requests * 0.8  # 80% success threshold
 
     def test_mstp_rapid_fire(self):
-        """Test 6: Rapid requests to MS/TP device"""
+        """Test 6: Rapid pipelined requests to MS/TP device, all in flight at once"""
         print("\n" + "="*70)
         print("TEST 6: MS/TP Rapid-Fire Performance Test")
         print("="*70)
 
-        mstp_devices = [(d, i) for d, i in self.devices.items() if i.get('network')]
+        mstp_devices = [(d, i) for d, i in self.devices.items() if i.network]
         if not mstp_devices:
             print("  No MS/TP devices found")
             return False
@@ -651,14 +882,21 @@ class BACnetTester:
         failures = 0
         times = []
 
-        start_total = time.time()
+        # Cycle through the first 10 properties; only the invoke ID differs between
+        # requests for the same property
+        templates = self.read_property_templates(
+            dev_id, _PROPERTY_IDS[:10], dev_info.network, dev_info.mac)
+        requests = []
         for i in range(num_requests):
-            prop_id = list(PROPERTIES.values())[i % 10]  # Cycle through first 10 properties
-            apdu, _ = self.build_read_property(8, dev_id, prop_id)
-            npdu = self.build_npdu_routed(apdu, dev_info['network'], dev_info['mac'])
-            bvlc = self.build_bvlc(npdu)
-
-            response, elapsed = self.send_receive(bvlc, timeout=3.0)
+            head, tail = templates[_PROPERTY_IDS[i % 10]]
+            invoke_id = self.next_invoke_id()
+            requests.append((invoke_id, head + _INVOKE_ID_BYTE[invoke_id] + tail))
+
+        # All requests go out in one batch; replies are matched back by invoke ID
+        start_total = time.perf_counter()
+        replies = self.send_batch_receive(requests, timeout=3.0)
+        for invoke_id, _ in requests:
+            response, elapsed = replies.get(invoke_id, (None, None))
             if response:
                 ack, error = self.parse_read_property_ack(response)
                 if ack:
@@ -669,9 +907,9 @@ class BACnetTester:
                     self.errors_by_type[error] += 1
             else:
                 failures += 1
-                self.errors_by_type['TIMEOUT'] += 1
+                self.errors_by_type[TIMEOUT] += 1
 
-        total_elapsed = time.time() - start_total
+        total_elapsed = time.perf_counter() - start_total
 
         if times:
             avg_time = sum(times) / len(times)
@@ -682,7 +920,7 @@ class BACnetTester:
             print(f"\nResults: {success}/{num_requests} successful")
             print(f"  Total time: {total_elapsed:.2f}s")
             print(f"  Requests/sec: {requests_per_sec:.1f}")
-            print(f"  Response times: avg={avg_time*1000:.1f}ms, min={min_time*1000:.1f}ms, max={max_time*1000:.1f}ms")
+            print(f"  Time to reply with all {num_requests} in flight: avg={avg_time*1000:.1f}ms, min={min_time*1000:.1f}ms, max={max_time*1000:.1f}ms")
         else:
             print(f"  All requests failed!")
 
@@ -702,8 +940,7 @@ class BACnetTester:
         tests_total += 1
         apdu, _ = self.build_read_property(8, 1234, 9999)  # Proprietary property
         npdu = self.build_npdu_local(apdu, expecting_reply=True)
-        bvlc = self.build_bvlc(npdu)
-        response, elapsed = self.send_receive(bvlc)
+        response, elapsed = self.send_receive(self.bvlc_parts(npdu))
         if response:
             ack, error = self.parse_read_property_ack(response)
             if error and 'Error' in error:
@@ -721,8 +958,7 @@ class BACnetTester:
         tests_total += 1
         apdu, _ = self.build_read_property(8, 99999999, 75)  # Non-existent device
         npdu = self.build_npdu_local(apdu, expecting_reply=True)
-        bvlc = self.build_bvlc(npdu)
-        response, elapsed = self.send_receive(bvlc)
+        response, elapsed = self.send_receive(self.bvlc_parts(npdu))
         if response:
             ack, error = self.parse_read_property_ack(response)
             if error:
@@ -738,15 +974,8 @@ class BACnetTester:
         print("\n7c: Request to unknown network (59999)...")
         tests_total += 1
         apdu, _ = self.build_read_property(8, 1234, 75)
-        npdu = bytearray([
-            0x01, 0x24,  # Version, control (dest + expecting reply)
-            0xEA, 0x5F,  # DNET = 59999
-            0x01, 0x01,  # DLEN=1, DADR=1
-            0xff,  # Hop count
-        ])
-        npdu.extend(apdu)
-        bvlc = self.build_bvlc(bytes(npdu))
-        response, elapsed = self.send_receive(bvlc, timeout=5.0)
+        npdu = self.build_npdu_routed(apdu, 59999, 1)  # DNET = 59999, DADR = 1
+        response, elapsed = self.send_receive(self.bvlc_parts(npdu), timeout=5.0)
         if response:
             # Check for Reject-Message-To-Network
             if len(response) > 10:
@@ -772,22 +1001,55 @@ class BACnetTester:
         print(f"  Timeouts: {self.stats['timeouts']}")
         print(f"  Errors: {self.stats['errors']}")
 
-        if self.stats['responses_received'] > 0:
-            avg_time = self.stats['total_time'] / self.stats['responses_received']
-            print(f"\nResponse Times:")
+        if self.stats['timed_responses'] > 0:
+            avg_time = self.stats['total_time'] / self.stats['timed_responses']
+            print("\nResponse Times (one request at a time):")
             print(f"  Average: {avg_time*1000:.1f}ms")
             print(f"  Min: {self.stats['min_time']*1000:.1f}ms")
             print(f"  Max: {self.stats['max_time']*1000:.1f}ms")
 
+        if self.stats['pipelined_responses'] > 0:
+            avg_time = self.stats['pipelined_total_time'] / self.stats['pipelined_responses']
+            print("\nTime to Reply (pipelined batches, from the batch send):")
+            print(f"  Average: {avg_time*1000:.1f}ms")
+            print(f"  Min: {self.stats['pipelined_min_time']*1000:.1f}ms")
+            print(f"  Max: {self.stats['pipelined_max_time']*1000:.1f}ms")
+
         if self.errors_by_type:
             print(f"\nErrors by Type:")
-            for error_type, count in sorted(self.errors_by_type.items(), key=lambda x: -x[1]):
+            for error_type, count in self.errors_by_type.most_common():
                 print(f"  {error_type}: {count}")
 
         success_rate = self.stats['responses_received'] / max(1, self.stats['requests_sent']) * 100
         print(f"\nSuccess Rate: {success_rate:.1f}%")
 
 
+def raise_priority():
+    """Best effort at keeping the scheduler out of the response-time measurements
+
+    Tries SCHED_FIFO, then nice -10 (both usually need root or CAP_SYS_NICE), and pins
+    the process to one CPU so it isn't migrated mid-test. Returns a description of what
+    was granted.
+    """
+    granted = []
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(50))
+        granted.append("SCHED_FIFO")
+    except (AttributeError, OSError):
+        try:
+            os.nice(-10)
+            granted.append("nice -10")
+        except (AttributeError, OSError):
+            pass
+    try:
+        cpu = min(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, {cpu})
+        granted.append(f"CPU {cpu}")
+    except (AttributeError, OSError):
+        pass
+    return ", ".join(granted) or "default"
+
+
 def main():
     parser = argparse.ArgumentParser(description='BACnet Gateway Stress Test')
     parser.add_argument('--gateway', '-g', default='192.168.71.1',
@@ -801,6 +1063,7 @@ def main():
     print("="*70)
     print(f"Gateway: {args.gateway}:{args.port}")
     print(f"Started: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Scheduling: {raise_priority()}")
 
     tester = BACnetTester(args.gateway, args.port)
     tester.create_socket()
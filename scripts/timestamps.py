@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""Wall-clock log timestamps shared by the MS/TP and gateway test scripts.
+
+strftime is comparatively slow, so the HH:MM:SS part is only rebuilt when the
+second changes; every other call just appends the milliseconds.
+"""
+
+import time
+
+# Wall-clock second last formatted by timestamp(), and its HH:MM:SS string
+_last_second = None
+_last_second_str = ''
+
+
+def timestamp():
+    """HH:MM:SS.mmm for now; strftime only runs when the second changes."""
+    global _last_second, _last_second_str
+    second, ns = divmod(time.time_ns(), 1_000_000_000)
+    if second != _last_second:
+        _last_second = second
+        _last_second_str = time.strftime('%H:%M:%S', time.localtime(second))
+    return f'{_last_second_str}.{ns // 1_000_000:03d}'